@@ -31,6 +31,7 @@ Implementation Notes
  * Adafruit CircuitPython firmware for the supported boards:
    https://github.com/adafruit/circuitpython/releases
 """
+import errno
 import struct
 import time
 
@@ -39,41 +40,186 @@ __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_NTP.git"
 
 NTP_TO_UNIX_EPOCH = 2208988800  # 1970-01-01 00:00:00
 
+# Leap indicator value for an unsynchronised server clock
+_LI_ALARM = 3
+_MODE_SERVER = 4
+_MAX_STRATUM = 15
+
+
+def _ntp_to_ns(packet, offset):
+    """Convert the NTP timestamp at offset in packet to nanoseconds since the unix epoch."""
+    seconds, fraction = struct.unpack_from("!II", packet, offset)
+    return (seconds - NTP_TO_UNIX_EPOCH) * 1_000_000_000 + (fraction * 1_000_000_000 >> 32)
+
+
 class NTP:
     """Network Time Protocol (NTP) helper module for CircuitPython.
     This module does not handle daylight savings or local time. It simply requests
     UTC from a NTP server.
+
+    Each sync sends ``samples`` requests to every server and keeps the reply with the lowest round-trip
+    delay. The clock offset is computed from all four timestamps of the exchange, so the time is accurate
+    to a fraction of the round-trip delay. Kiss-of-death and unsynchronised replies are rejected.
+
+    ``sync`` blocks until the replies arrive. From a scheduler use ``sync_async`` instead, it polls a
+    non-blocking socket and awaits the given sleep function while waiting.
+
     :param object socketpool: A socket provider such as CPython's `socket` module.
+    :param str server: The NTP server to query, ignored when ``servers`` is given.
+    :param tuple servers: NTP servers to query.
+    :param int samples: Number of requests sent to each server per sync.
+    :param float socket_timeout: Seconds to wait for a reply.
     """
 
-    def __init__(self, socketpool, *, server="pool.ntp.org", port=123):
+    def __init__(self, socketpool, *, server="pool.ntp.org", port=123, servers=None, samples=1, socket_timeout=10):
         self._pool = socketpool
-        self._server = server
+        self._servers = (server,) if servers is None else servers
         self._port = port
+        self._samples = samples
+        self._socket_timeout = socket_timeout
         self._packet = bytearray(48)
+        self._addresses = {}
 
-
-        # This is our estimated start time for the monotonic clock.
+        # Offset between the monotonic clock and UTC in nanoseconds.
         # We adjust it based on the ntp responses.
-        self._monotonic_start = 0
+        self._monotonic_offset = 0
+        # Round-trip delay of the sample the offset was taken from.
+        self.delay_ns = None
 
         self.next_sync = 0
 
     @property
     def datetime(self):
+        """Current UTC time as a `time.struct_time`, synchronised when the poll interval expired."""
+        return time.localtime(self.utc_ns // 1_000_000_000)
+
+    @property
+    def utc_ns(self):
+        """Current UTC time in nanoseconds since the unix epoch, synchronised when the poll interval expired."""
         if time.monotonic_ns() > self.next_sync:
-            self._packet[0] = 0b00100011  # Not leap second, NTP version 4, Client mode
-            for i in range(1, len(self._packet)):
-                self._packet[i] = 0
-            with self._pool.socket(self._pool.AF_INET, self._pool.SOCK_DGRAM) as sock:
-                sock.sendto(self._packet, (self._server, self._port))
-                size, address = sock.recvfrom_into(self._packet)
-                # Get the time in the context to minimize the difference between it and receiving
-                # the packet.
-                destination = time.monotonic_ns()
-            poll = struct.unpack_from("!B", self._packet, offset=2)[0]
-            self.next_sync = destination + (2 ** poll) * 1_000_000_000
-            seconds = struct.unpack_from("!I", self._packet, offset=len(self._packet) - 8)[0]
-            self._monotonic_start = seconds - NTP_TO_UNIX_EPOCH - (destination // 1_000_000_000)
-
-        return time.localtime(time.monotonic_ns() // 1_000_000_000 + self._monotonic_start)
\ No newline at end of file
+            self.sync()
+        return time.monotonic_ns() + self._monotonic_offset
+
+    @property
+    def clock_ns(self):
+        """Current UTC time in nanoseconds since the unix epoch from the offset of the last sync. Never queries the
+        servers, use it after ``sync_async`` where ``utc_ns`` could fall back to the blocking ``sync``."""
+        return time.monotonic_ns() + self._monotonic_offset
+
+    def sync(self):
+        """Query the servers and adopt the offset of the reply with the lowest delay."""
+        best = None
+        for server in self._servers:
+            for _ in range(self._samples):
+                try:
+                    sample = self._query(server)
+                except OSError as error:
+                    print("NTP request to {} failed: {}".format(server, error))
+                    continue
+                if sample is not None and (best is None or sample[1] < best[1]):
+                    best = sample
+        if best is None:
+            raise RuntimeError("No usable NTP reply")
+
+        self._monotonic_offset, self.delay_ns, poll = best
+        self.next_sync = time.monotonic_ns() + (2 ** poll) * 1_000_000_000
+
+    async def sync_async(self, sleep, *, timeout=2, retries=2, interval=0.01):
+        """Like `sync`, without blocking. The socket is polled every ``interval`` seconds and ``sleep(seconds)``
+        is awaited in between, e.g. ``asynccp.delay``. A request without a reply within ``timeout`` seconds is
+        sent again up to ``retries`` times. Polling adds up to ``interval`` to the measured delay, keeping the
+        sample with the lowest delay also keeps the one that was picked up quickest."""
+        best = None
+        for server in self._servers:
+            for _ in range(self._samples):
+                for attempt in range(retries + 1):
+                    try:
+                        sample = await self._query_async(server, sleep, timeout, interval)
+                        break
+                    except OSError as error:
+                        print("NTP request to {} failed: {}".format(server, error))
+                        sample = None
+                if sample is not None and (best is None or sample[1] < best[1]):
+                    best = sample
+        if best is None:
+            raise RuntimeError("No usable NTP reply")
+
+        self._monotonic_offset, self.delay_ns, poll = best
+        self.next_sync = time.monotonic_ns() + (2 ** poll) * 1_000_000_000
+
+    def _query(self, server):
+        """Run one exchange, returns (offset, delay, poll) or None when the reply is not usable."""
+        packet = self._packet
+        with self._pool.socket(self._pool.AF_INET, self._pool.SOCK_DGRAM) as sock:
+            sock.settimeout(self._socket_timeout)
+            originate = self._prepare()
+            sock.sendto(packet, (server, self._port))
+            sock.recvfrom_into(packet)
+            # Get the time in the context to minimize the difference between it and receiving
+            # the packet.
+            destination = time.monotonic_ns()
+        return self._parse(packet, originate, destination)
+
+    async def _query_async(self, server, sleep, timeout, interval):
+        packet = self._packet
+        address = self._address(server)
+        with self._pool.socket(self._pool.AF_INET, self._pool.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            originate = self._prepare()
+            sock.sendto(packet, address)
+            deadline = originate + int(timeout * 1_000_000_000)
+            while True:
+                try:
+                    sock.recvfrom_into(packet)
+                    destination = time.monotonic_ns()
+                    break
+                except OSError as error:
+                    if error.errno not in (errno.EAGAIN, errno.ETIMEDOUT):
+                        raise
+                if time.monotonic_ns() > deadline:
+                    raise OSError(errno.ETIMEDOUT, "no reply")
+                await sleep(interval)
+        return self._parse(packet, originate, destination)
+
+    def _address(self, server):
+        # resolve once, name lookups block
+        address = self._addresses.get(server)
+        if address is None:
+            address = self._pool.getaddrinfo(server, self._port)[0][4]
+            self._addresses[server] = address
+        return address
+
+    def _prepare(self):
+        """Fill in the request packet, returns the originate timestamp."""
+        packet = self._packet
+        packet[0] = 0b00100011  # Not leap second, NTP version 4, Client mode
+        for i in range(1, len(packet)):
+            packet[i] = 0
+        # The transmit timestamp is our own clock, the server returns it as the originate timestamp.
+        originate = time.monotonic_ns()
+        struct.pack_into("!II", packet, 40, originate // 1_000_000_000, originate % 1_000_000_000)
+        return originate
+
+    @staticmethod
+    def _parse(packet, originate, destination):
+        leap = packet[0] >> 6
+        mode = packet[0] & 0x07
+        stratum = packet[1]
+        if mode != _MODE_SERVER or leap == _LI_ALARM or stratum > _MAX_STRATUM:
+            return None
+        if stratum == 0:
+            # Kiss-of-death, the reference id holds the ASCII code, e.g. RATE or DENY
+            print("NTP kiss-of-death: {}".format(bytes(packet[12:16])))
+            return None
+        # Reject replies that don't answer our request
+        seconds, fraction = struct.unpack_from("!II", packet, 24)
+        if seconds != originate // 1_000_000_000 or fraction != originate % 1_000_000_000:
+            return None
+        if packet[40:48] == b"\0\0\0\0\0\0\0\0":
+            return None
+
+        receive = _ntp_to_ns(packet, 32)
+        transmit = _ntp_to_ns(packet, 40)
+        offset = ((receive - originate) + (transmit - destination)) // 2
+        delay = (destination - originate) - (transmit - receive)
+        return offset, delay, packet[2]
@@ -1,12 +1,23 @@
 
-from adafruit_datetime import datetime
 import adafruit_requests as requests
 import json
 import time
 import board
+import io
 import os
+import random
 import traceback
 
+# gzip compression of uploads needs either the deflate module (MicroPython style DeflateIO) or CPython's zlib
+try:
+    import deflate
+except ImportError:
+    deflate = None
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
 # Application Insights SDK for CircuitPython
 #
 # This is a (very) rudimentry ApplicationInsights SDK for CircuitPython and allows you to log traces, metrics and exceptions to Azure
@@ -23,8 +34,27 @@ import traceback
 #
 # ⚠ Warning
 # This was developed and tested on an UnexpectedMaker Feather S2 that has tons of RAM and Wifi built in
-# Please be aware that the data to be uploaded to AI will be kept in memory until uploaded. If you collect a lot of 
-# telemetry or wait too long to upload the data you're likely to run out of memory
+# Please be aware that the data to be uploaded to AI will be kept in memory until uploaded. The pending queue is capped
+# by max_items and max_bytes; once full, the overflow policy decides what gets dropped. Dropped items are counted and
+# reported as the telemetry.dropped metric on the next successful upload.
+# With aggregate_metrics enabled, metric values are folded per name and sent as a single aggregated item per upload.
+# Uploads are serialized item by item into a reusable buffer of batch_size bytes and posted in batches, so the
+# queue is never converted into one big JSON string.
+# Queued items are kept as compact records, the constant parts of the envelopes are prepared once per Telemetry
+# object and the JSON is only produced when the items are serialized for upload.
+# Pass a spool.Spool to keep telemetry on flash: items evicted from a full queue, which includes items queued again
+# after a failed upload, and everything queued while offline (see offload) are written to the spool. Call
+# replay_spool periodically to upload the spooled items in small batches once connected again.
+# Partially accepted batches (206) are parsed and only the items rejected with a retriable status are queued again.
+# Throttling and server errors back off exponentially with jitter, or as long as Retry-After asks, before the next
+# upload is attempted.
+# With compress enabled, batches of at least compress_threshold bytes are sent gzip compressed when the runtime can
+# compress. The achieved ratio is reported as the telemetry.compressionRatio metric.
+# Items are timestamped with time.time() unless a timestamp is passed in. When the board's clock is not set, pass a
+# clock that returns the current time as epoch seconds or an ISO 8601 string, it's also used for the telemetry.dropped
+# and telemetry.compressionRatio metrics.
+# By default the telemetry is sent to Application Insights, pass an exporter to send it elsewhere: MqttExporter
+# publishes the batches over a long lived MQTT connection and AdafruitIOExporter sends the metrics to Adafruit IO feeds.
 
 
 # https://github.com/microsoft/ApplicationInsights-JS/blob/master/shared/AppInsightsCommon/src/Interfaces/Contracts/Generated/SeverityLevel.ts
@@ -36,9 +66,159 @@ class Severity:
     Critical: int = 4
 
 
-class Telemetry:
-    def __init__(self, instrumentation_key:str, endpoint_url:str=None, debug:bool=False):
-        self.instrumentationKey = instrumentation_key
+# What to drop when the pending queue exceeds its item or byte budget
+class Overflow:
+    DropOldest: int = 0             # drop the oldest item
+    DropBySeverity: int = 1         # drop the oldest item with the lowest severity, metrics rank as Information
+    KeepLatestPerMetric: int = 2    # drop the oldest metric superseded by a newer one with the same name, then the oldest item
+
+# Rough size of the envelope around the payload of a single item (iKey, name, tags, time and JSON structure)
+_ENVELOPE_OVERHEAD = 400
+
+# Status codes for which the ingestion endpoint asks to send the items again
+# https://github.com/microsoft/ApplicationInsights-JS/blob/master/channels/applicationinsights-channel-js/src/Sender.ts
+_RETRIABLE = (408, 429, 439, 500, 502, 503, 504)
+
+
+# Kinds of queued items
+_MESSAGE = 0
+_EXCEPTION = 1
+_METRIC = 2
+
+
+# Compact record of a queued item, time is either an ISO 8601 string or seconds since the epoch
+class _Item:
+    __slots__ = ("kind", "time", "severity", "name", "message", "stack", "value", "count", "min", "max", "stdDev")
+
+    def __init__(self, kind:int, time, severity:int, name:str=None, message:str=None, stack:str=None, value=None, count:int=None, min:float=None, max:float=None, stdDev:float=None):
+        self.kind = kind
+        self.time = time
+        self.severity = severity
+        self.name = name
+        self.message = message
+        self.stack = stack
+        self.value = value
+        self.count = count
+        self.min = min
+        self.max = max
+        self.stdDev = stdDev
+
+
+def _isoformat(timestamp:int) -> str:
+    t = time.localtime(timestamp)
+    return '{:04}-{:02}-{:02}T{:02}:{:02}:{:02}'.format(t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+# Running count, sum, min, max and variance (Welford) of the values reported for one metric
+class _MetricAggregate:
+    def __init__(self, value, timestamp):
+        self.timestamp = timestamp
+        self.count = 1
+        self.sum = value
+        self.mean = value
+        self.m2 = 0.0
+        self.min = value
+        self.max = value
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def stdDev(self) -> float:
+        return (self.m2 / self.count) ** 0.5
+
+
+class _BatchFull(Exception):
+    pass
+
+
+# Serializes items into a preallocated buffer as a JSON array
+# CircuitPython's json.dump only writes to native streams, serializers write the result of json.dumps to it instead.
+class _BatchWriter:
+    def __init__(self, size:int):
+        self.size = size
+        self._buffer = bytearray(size)
+        self._length = 0
+        self.count = 0
+
+    def begin(self):
+        self._buffer[0] = 0x5B # [
+        self._length = 1
+        self.count = 0
+
+    def append(self, serialize, item) -> bool:
+        """ Add an item to the batch using serialize(item, stream), returns False when it does not fit """
+        start = self._length
+        try:
+            if self.count > 0:
+                self.write(b',')
+            serialize(item, self)
+            # keep room for the closing bracket
+            if self._length >= len(self._buffer):
+                raise _BatchFull()
+        except _BatchFull:
+            self._length = start
+            return False
+        except Exception:
+            self._length = start
+            raise
+        self.count += 1
+        return True
+
+    def encode(self, serialize, item):
+        """ Serialize a single item on its own, returns None when it would not fit in a batch """
+        self._length = 0
+        self.count = 0
+        try:
+            serialize(item, self)
+        except _BatchFull:
+            return None
+        # a batch needs room for the brackets around the item
+        if self._length > len(self._buffer) - 2:
+            return None
+        return memoryview(self._buffer)[:self._length]
+
+    def end(self) -> memoryview:
+        self._buffer[self._length] = 0x5D # ]
+        return memoryview(self._buffer)[:self._length + 1]
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        end = self._length + len(data)
+        if end > len(self._buffer):
+            raise _BatchFull()
+        self._buffer[self._length:end] = data
+        self._length = end
+
+
+# Exporters send the serialized batches to a backend. Telemetry does the queueing, batching into JSON arrays, spooling
+# and backing off, the exporter decides which items it accepts, how an item is serialized and how a batch is sent.
+# send returns a tuple of the indexes in the batch that must be sent again after a backoff, the number of items the
+# backend rejected for good, the Retry-After value of the backend (or None) and the indexes of the items the exporter
+# can't send yet, those are queued again without backing off.
+# Spooled items are stored as serialized by the exporter, a spool can only be replayed by the same kind of exporter.
+class Exporter:
+    def accepts(self, item:_Item) -> bool:
+        return True
+
+    def serialize(self, item:_Item, stream):
+        raise NotImplementedError()
+
+    def send(self, telemetry, requests, payload:memoryview, count:int):
+        raise NotImplementedError()
+
+
+class ApplicationInsightsExporter(Exporter):
+    def __init__(self, instrumentation_key:str, endpoint_url:str=None, debug:bool=False, compress:bool=False, compress_threshold:int=1024):
         if endpoint_url is None:
             self._endpointUrl = "https://dc.services.visualstudio.com/v2/track"
         else:
@@ -50,94 +230,604 @@ class Telemetry:
             "ai.device.model": board.board_id,
             "ai.device.type": "IoT"
         }
+        self._compress = compress and (deflate is not None or hasattr(zlib, "compressobj"))
+        if compress and not self._compress:
+            print("Telemetry compression is not supported on this runtime")
+        self._compressThreshold = compress_threshold
+        self._headers = {"Content-Type": "application/json"}
+        self._gzipHeaders = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+        # constant head of the envelope per kind of item, up to the fields of baseData
+        head = '{"iKey":' + json.dumps(instrumentation_key) + ',"tags":' + json.dumps(self._defaultTags) + ',"name":'
+        self._templates = tuple(
+            (head + json.dumps("Microsoft.ApplicationInsights.{}.{}".format(instrumentation_key.replace('-', ''), kind)) + ',"data":{"baseType":"' + kind + 'Data","baseData":{"ver":2,').encode()
+            for kind in ("Message", "Exception", "Metric")
+        )
+
+    def serialize(self, item:_Item, stream):
+        # https://github.com/microsoft/ApplicationInsights-JS/blob/master/channels/applicationinsights-channel-js/src/EnvelopeCreator.ts
+        stream.write(self._templates[item.kind])
+        if item.kind == _METRIC:
+            # only one metric can be passed in
+            stream.write('"metrics":[{"name":')
+            stream.write(json.dumps(item.name))
+            stream.write(',"value":')
+            stream.write(json.dumps(item.value))
+            stream.write(',"count":')
+            stream.write(json.dumps(item.count))
+            stream.write(',"max":')
+            stream.write(json.dumps(item.max))
+            stream.write(',"min":')
+            stream.write(json.dumps(item.min))
+            stream.write(',"stdDev":')
+            stream.write(json.dumps(item.stdDev))
+            stream.write('}]')
+        else:
+            if item.kind == _EXCEPTION:
+                stream.write('"exceptions":[{"hasFullStack":true,"typeName":')
+                stream.write(json.dumps(item.name))
+                stream.write(',"stack":')
+                stream.write(json.dumps(item.stack))
+                stream.write(',')
+            stream.write('"message":')
+            stream.write(json.dumps(item.message))
+            if item.kind == _EXCEPTION:
+                stream.write('}]')
+            stream.write(',"severityLevel":')
+            stream.write(json.dumps(item.severity))
+        stream.write('}},"time":')
+        stream.write(json.dumps(item.time if isinstance(item.time, str) else _isoformat(item.time)))
+        stream.write('}')
+
+    def send(self, telemetry, requests: requests.Session, payload:memoryview, count:int):
+        if( self._debug ):
+            print("AI Url: {}\nPayload: {}".format(self._endpointUrl, str(payload, 'utf-8')))
+
+        headers = self._headers
+        if self._compress and len(payload) >= self._compressThreshold:
+            size = len(payload)
+            payload = self._gzip(payload)
+            headers = self._gzipHeaders
+            telemetry.metric('telemetry.compressionRatio', size / len(payload))
+
+        try:
+            response = requests.post(url=self._endpointUrl, data=payload, headers=headers)
+        except Exception as ex:
+            print("ApplicationInsights upload failed: ", ex)
+            return range(count), 0, None, ()
+
+        with response:
+            # the body can only be read once, adafruit_requests refuses json() after text
+            text = response.text
+            if( self._debug ):
+                print("Response: {}".format(text))
+            status = response.status_code
+            if status == 200:
+                return (), 0, None, ()
+
+            if status != 206:
+                print("ApplicationInsights failed with status {}".format(status))
+            if status in _RETRIABLE:
+                return range(count), 0, response.headers.get("retry-after"), ()
+            if status != 206 and status != 400:
+                return (), count, None, ()
+
+            # partial success, the errors list the rejected items by their index in the batch
+            try:
+                errors = json.loads(text).get("errors", ())
+            except Exception:
+                errors = ()
+            if status == 400 and len(errors) == 0:
+                return (), count, None, ()
+
+            retry = []
+            rejected = 0
+            for error in errors:
+                if error.get("statusCode") in _RETRIABLE:
+                    retry.append(error["index"])
+                else:
+                    rejected += 1
+            return retry, rejected, response.headers.get("retry-after"), ()
+
+    @staticmethod
+    def _gzip(payload:memoryview) -> bytes:
+        if deflate is not None:
+            stream = io.BytesIO()
+            with deflate.DeflateIO(stream, deflate.GZIP) as compressor:
+                compressor.write(payload)
+            return stream.getvalue()
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return compressor.compress(payload) + compressor.flush()
+
+
+# Item as a compact JSON object, for backends that don't expect Application Insights envelopes
+def _writeCompact(item:_Item, stream):
+    stream.write(('{"type":"Message"', '{"type":"Exception"', '{"type":"Metric"')[item.kind])
+    if item.kind == _METRIC:
+        stream.write(',"name":')
+        stream.write(json.dumps(item.name))
+        stream.write(',"value":')
+        stream.write(json.dumps(item.value))
+        if item.count is not None:
+            stream.write(',"count":')
+            stream.write(json.dumps(item.count))
+            stream.write(',"min":')
+            stream.write(json.dumps(item.min))
+            stream.write(',"max":')
+            stream.write(json.dumps(item.max))
+            stream.write(',"stdDev":')
+            stream.write(json.dumps(item.stdDev))
+    else:
+        if item.kind == _EXCEPTION:
+            stream.write(',"typeName":')
+            stream.write(json.dumps(item.name))
+            stream.write(',"stack":')
+            stream.write(json.dumps(item.stack))
+        stream.write(',"message":')
+        stream.write(json.dumps(item.message))
+        stream.write(',"severityLevel":')
+        stream.write(json.dumps(item.severity))
+    stream.write(',"time":')
+    stream.write(json.dumps(item.time if isinstance(item.time, str) else _isoformat(item.time)))
+    stream.write('}')
+
+
+# Publishes every batch as a single message over one long lived MQTT connection (adafruit_minimqtt.MQTT client).
+# Call maintain() more often than half the keep alive interval of the client so the broker keeps the connection open
+# between uploads. With QoS 1 publish waits for the broker to acknowledge the message.
+class MqttExporter(Exporter):
+    def __init__(self, client, topic:str, qos:int=1):
+        self._client = client
+        self._topic = topic
+        self._qos = qos
+        self._connected = False
+        self._lastActivity = 0
+        self.published = 0
+
+    def serialize(self, item:_Item, stream):
+        _writeCompact(item, stream)
+
+    def send(self, telemetry, requests, payload:memoryview, count:int):
+        try:
+            self._connect()
+            self._client.publish(self._topic, bytes(payload), qos=self._qos)
+        except Exception as ex:
+            print("MQTT publish failed: ", ex)
+            self.close()
+            return range(count), 0, None, ()
+        self._lastActivity = time.monotonic()
+        self.published += 1
+        return (), 0, None, ()
+
+    def maintain(self):
+        """ Ping the broker when the connection has been idle for half the keep alive interval """
+        if not self._connected or time.monotonic() - self._lastActivity < self._client.keep_alive / 2:
+            return
+        try:
+            self._client.ping()
+        except Exception as ex:
+            print("MQTT connection lost: ", ex)
+            self.close()
+            return
+        self._lastActivity = time.monotonic()
+
+    def _connect(self):
+        if not self._connected:
+            self._client.connect()
+            self._connected = True
+            self._lastActivity = time.monotonic()
+
+    def close(self):
+        """ Drop the connection, e.g. when the network is gone, the next batch connects again """
+        self._connected = False
+        try:
+            self._client.disconnect()
+        except Exception:
+            pass
+
+
+# Sends metrics to Adafruit IO, a batch results in one data/batch request per feed. Feed keys are derived from the
+# metric names (ambient.temperature => ambient-temperature) unless feeds maps them, with a mapping only the metrics in
+# it are sent. Traces and exceptions are not accepted.
+# With a feed_registry.FeedRegistry the values of all feeds taken at the same time are sent in one request to the
+# group of the registry. Values for feeds the registry doesn't know yet are held back until it has resolved them.
+# IO_HTTP.send_batch_data is not used, in the bundled adafruit_io 5.6.0 it posts to an uncomposed path.
+class AdafruitIOExporter(Exporter):
+    def __init__(self, username:str, key:str, feeds:dict=None, registry=None):
+        self._url = "https://io.adafruit.com/api/v2/" + username + "/feeds/{}/data/batch"
+        self._headers = {"X-AIO-KEY": key}
+        self._feeds = feeds
+        self._registry = registry
+
+    def accepts(self, item:_Item) -> bool:
+        return item.kind == _METRIC and (self._feeds is None or item.name in self._feeds)
+
+    def feedKey(self, name:str) -> str:
+        if self._feeds is not None:
+            return self._feeds[name]
+        return name.replace('.', '-').replace('_', '-').lower()
+
+    def serialize(self, item:_Item, stream):
+        stream.write('{"feed":')
+        stream.write(json.dumps(self.feedKey(item.name)))
+        stream.write(',"value":')
+        # aggregated metrics carry the sum of the samples
+        stream.write(json.dumps(item.value / item.count if item.count else item.value))
+        stream.write(',"created_at":')
+        stream.write(json.dumps(item.time if isinstance(item.time, str) else _isoformat(item.time)))
+        stream.write('}')
+
+    def send(self, telemetry, requests, payload:memoryview, count:int):
+        records = json.loads(str(payload, 'utf-8'))
+        if self._registry is not None:
+            return self._sendToGroup(requests, records)
+        feeds = {}
+        for i, record in enumerate(records):
+            feed = record.pop("feed")
+            indexes = feeds.get(feed)
+            if indexes is None:
+                feeds[feed] = [i]
+            else:
+                indexes.append(i)
+
+        retry = []
+        rejected = 0
+        retryAfter = None
+        for feed, indexes in feeds.items():
+            if len(retry) > 0:
+                # don't continue after a failure, the rest is sent after the backoff
+                retry.extend(indexes)
+                continue
+            try:
+                response = requests.post(self._url.format(feed), json={"data": [records[i] for i in indexes]}, headers=self._headers)
+            except Exception as ex:
+                print("Adafruit IO upload failed: ", ex)
+                retry.extend(indexes)
+                continue
+            with response:
+                status = response.status_code
+                if status == 200:
+                    continue
+                print("Adafruit IO failed with status {} for feed {}".format(status, feed))
+                if status in _RETRIABLE:
+                    retry.extend(indexes)
+                    retryAfter = response.headers.get("retry-after")
+                else:
+                    rejected += len(indexes)
+        return retry, rejected, retryAfter, ()
+
+    def _sendToGroup(self, requests, records:list):
+        registry = self._registry
+        retry = []
+        # values for feeds that don't exist yet wait for the registry, they don't count as failures
+        held = []
+        # indexes of the records per timestamp, the group data API takes one created_at per request
+        times = {}
+        for i, record in enumerate(records):
+            if not registry.known(record["feed"]):
+                held.append(i)
+                continue
+            indexes = times.get(record["created_at"])
+            if indexes is None:
+                times[record["created_at"]] = [i]
+            else:
+                indexes.append(i)
+
+        rejected = 0
+        retryAfter = None
+        failed = False
+        for createdAt, indexes in times.items():
+            if failed:
+                retry.extend(indexes)
+                continue
+            data = {"feeds": [{"key": records[i]["feed"], "value": records[i]["value"]} for i in indexes], "created_at": createdAt}
+            try:
+                response = requests.post(registry.groupDataUrl, json=data, headers=registry.headers)
+            except Exception as ex:
+                print("Adafruit IO upload failed: ", ex)
+                retry.extend(indexes)
+                failed = True
+                continue
+            with response:
+                status = response.status_code
+                if status == 200:
+                    continue
+                print("Adafruit IO failed with status {} for group {}".format(status, registry.group))
+                if status in _RETRIABLE:
+                    retry.extend(indexes)
+                    retryAfter = response.headers.get("retry-after")
+                    failed = True
+                elif status == 404:
+                    # a feed was deleted, send again once the registry created it
+                    for i in indexes:
+                        registry.forget(records[i]["feed"])
+                    held.extend(indexes)
+                else:
+                    rejected += len(indexes)
+        return retry, rejected, retryAfter, held
+
+
+class Telemetry:
+    def __init__(self, instrumentation_key:str, endpoint_url:str=None, debug:bool=False, max_items:int=200, max_bytes:int=65536, overflow:int=Overflow.DropOldest, aggregate_metrics:bool=False, batch_size:int=8192, spool=None, replay_batch:int=20, min_backoff:float=30, max_backoff:float=1800, compress:bool=False, compress_threshold:int=1024, exporter=None, clock=time.time):
+        self.instrumentationKey = instrumentation_key
+        self._clock = clock
+        if exporter is None:
+            exporter = ApplicationInsightsExporter(instrumentation_key, endpoint_url, debug=debug, compress=compress, compress_threshold=compress_threshold)
+        self._exporter = exporter
         self._pendingData = []
+        self._pendingBytes = 0
+        self._maxItems = max_items
+        self._maxBytes = max_bytes
+        self._overflow = overflow
+        self._dropped = 0
+        self._aggregate = aggregate_metrics
+        self._aggregates = {}
+        self._batch = _BatchWriter(batch_size)
+        self._spool = spool
+        self._replayBatch = replay_batch
+        self._minBackoff = min_backoff
+        self._maxBackoff = max_backoff
+        self._failures = 0
+        self._retryAt = 0
 
     def trace(self, message:str, severity:int = Severity.Verbose, timestamp:str = None):
         # https://github.com/microsoft/ApplicationInsights-JS/blob/master/shared/AppInsightsCommon/src/Telemetry/Trace.ts
-        telemetry = {
-            "time": datetime.now().isoformat() if timestamp is None else timestamp,
-            "name": "Microsoft.ApplicationInsights.{}.Message".format(self.instrumentationKey.replace('-', '')),
-            "iKey": self.instrumentationKey,
-            "tags": self._defaultTags,
-            "data": {
-                "baseType": "MessageData",
-                "baseData": {
-                    "ver": 2,
-                    "message": message,
-                    "severityLevel": severity,
-                    # "properties":
-                    # "measurements"
-                }
-            }
-        }
-        self._pendingData.append(telemetry)
+        self._enqueue(_Item(_MESSAGE, self._clock() if timestamp is None else timestamp, severity, message=message))
     
     def exception(self, exception:Exception, severity:int = Severity.Error, timestamp:str = None):
-        telemetry = {
-            "time": datetime.now().isoformat() if timestamp is None else timestamp,
-            "name": "Microsoft.ApplicationInsights.{}.Exception".format(self.instrumentationKey.replace('-', '')),
-            "iKey": self.instrumentationKey,
-            "tags": self._defaultTags,
-            "data": {
-                "baseType": "ExceptionData",
-                "baseData": {
-                    "ver": 2,
-                    "exceptions": [{
-                        "message": ''.join(traceback.format_exception(type(exception), exception, None)),
-                        "hasFullStack": True,
-                        "typeName": type(exception).__name__,
-                        "stack": ''.join(traceback.format_exception(exception, exception, exception.__traceback__))
-                    }],
-                    "severityLevel": severity
-                    # "properties":
-                    # "measurements"
-                }
-            }
-        }
-        self._pendingData.append(telemetry)
+        self._enqueue(_Item(_EXCEPTION, self._clock() if timestamp is None else timestamp, severity,
+            name=type(exception).__name__,
+            message=''.join(traceback.format_exception(type(exception), exception, None)),
+            stack=''.join(traceback.format_exception(exception, exception, exception.__traceback__))))
 
     def metric(self, name:str, value, count:int=None, min:float=None, max: float=None, stdDev: float=None, timestamp:str = None):
-        telemetry = {
-            "time": datetime.now().isoformat() if timestamp is None else timestamp,
-            "name": "Microsoft.ApplicationInsights.{}.Metric".format(self.instrumentationKey.replace('-', '')),
-            "iKey": self.instrumentationKey,
-            "tags": self._defaultTags,
-            "data": {
-                "baseType": "MetricData",
-                "baseData": {
-                    "ver": 2,
-                    "metrics": [{ # only one metric can be passed in
-                      "name": name,
-                      "value": value,
-                      "count": count,
-                      "max": max,
-                      "min": min,
-                      "stdDev": stdDev
-                    }]
-                    # "properties":
-                    # "measurements"
-                }
-            }
-        }
-        self._pendingData.append(telemetry)
+        if self._aggregate and count is None:
+            aggregate = self._aggregates.get(name)
+            if aggregate is None:
+                self._aggregates[name] = _MetricAggregate(value, self._clock() if timestamp is None else timestamp)
+            else:
+                aggregate.add(value)
+            return
+
+        self._enqueue(_Item(_METRIC, self._clock() if timestamp is None else timestamp, Severity.Information, name=name, value=value, count=count, min=min, max=max, stdDev=stdDev))
+
+    def flush_metrics(self):
+        """ Queue one aggregated item per metric name and start a new aggregation window """
+        aggregates = self._aggregates
+        self._aggregates = {}
+        for name, aggregate in aggregates.items():
+            # for aggregated data points AI expects the value to be the sum of the samples
+            self._enqueue(_Item(_METRIC, aggregate.timestamp, Severity.Information, name=name, value=aggregate.sum, count=aggregate.count, min=aggregate.min, max=aggregate.max, stdDev=aggregate.stdDev))
+
+    def offload(self):
+        """ Move the queued items to the spool, e.g. while there is no connection """
+        if self._spool is None:
+            return
+        self.flush_metrics()
+        pending = self._pendingData
+        self._pendingData = []
+        self._pendingBytes = 0
+        for item in pending:
+            if not self._spoolItem(item):
+                self._enqueue(item)
+
+    @property
+    def spooled(self) -> bool:
+        """ True when there are spooled items waiting to be replayed """
+        return self._spool is not None and self._spool.pending
+
+    @property
+    def dropped(self) -> int:
+        """ Number of items dropped since the last successful upload """
+        return self._dropped
+
+    def _enqueue(self, item:_Item):
+        if not self._exporter.accepts(item):
+            return
+        size = self._estimateSize(item)
+        if size > self._maxBytes:
+            self._dropped += 1
+            return
+
+        while len(self._pendingData) >= self._maxItems or self._pendingBytes + size > self._maxBytes:
+            self._evict()
+
+        self._pendingData.append(item)
+        self._pendingBytes += size
+
+    def _evict(self):
+        index = 0
+        if self._overflow == Overflow.DropBySeverity:
+            index = self._lowestSeverityIndex()
+        elif self._overflow == Overflow.KeepLatestPerMetric:
+            index = self._supersededMetricIndex()
+
+        item = self._pendingData.pop(index)
+        self._pendingBytes -= self._estimateSize(item)
+        if not self._spoolItem(item):
+            self._dropped += 1
+
+    def _spoolItem(self, item:_Item) -> bool:
+        if self._spool is None:
+            return False
+        record = self._batch.encode(self._exporter.serialize, item)
+        return record is not None and self._spool.append(record)
+
+    def _lowestSeverityIndex(self) -> int:
+        # oldest item with the lowest severity
+        lowest = None
+        for i, item in enumerate(self._pendingData):
+            if lowest is None or item.severity < lowest:
+                lowest = item.severity
+                index = i
+                if lowest == Severity.Verbose:
+                    break
+        return index
+
+    def _supersededMetricIndex(self) -> int:
+        # oldest metric for which a newer value with the same name is queued, walking back from the newest item
+        seen = set()
+        index = 0
+        for i in range(len(self._pendingData) - 1, -1, -1):
+            item = self._pendingData[i]
+            if item.kind != _METRIC:
+                continue
+            if item.name in seen:
+                index = i
+            else:
+                seen.add(item.name)
+        return index
+
+    @staticmethod
+    def _estimateSize(item:_Item) -> int:
+        size = _ENVELOPE_OVERHEAD
+        if item.kind == _METRIC:
+            size += 100 + len(item.name)
+        else:
+            size += len(item.message)
+            if item.stack is not None:
+                size += len(item.stack)
+        return size
 
     async def upload_telemetry(self, requests: requests.Session):
-        if len(self._pendingData) == 0:
+        self.flush_metrics()
+        if len(self._pendingData) == 0 or self.backingOff:
             return
 
         # swap the queue
         pending = self._pendingData
         self._pendingData = []
+        self._pendingBytes = 0
 
-        # send it off to AI
-        if( self._debug ):
-            print("AI Url: {}\nPayload: {}".format(self._endpointUrl, json.dumps(pending)))
+        # report what was lost since the last successful upload
+        queued = len(pending)
+        dropped = self._dropped
+        if dropped > 0:
+            item = _Item(_METRIC, self._clock(), Severity.Information, name='telemetry.dropped', value=dropped)
+            if self._exporter.accepts(item):
+                pending.append(item)
 
-        with requests.post(url=self._endpointUrl, json=pending ) as response:
-            if response.status_code != 200:
-                print("ApplicationInsights failed with status {}".format(response.status_code))
-            if( self._debug ):
-                print("Response: {}".format(response.text))
+        # send it off to AI, one batch at a time
+        index = 0
+        # indexes in pending of the items in the batch, items that can't be serialized are left out
+        appended = []
+        while index < len(pending):
+            batch = self._batch
+            batch.begin()
+            appended.clear()
+            while index < len(pending):
+                try:
+                    if not batch.append(self._exporter.serialize, pending[index]):
+                        break
+                    appended.append(index)
+                except Exception as ex:
+                    # an item the exporter can't serialize would fail every upload
+                    print("Telemetry item can't be serialized: ", ex)
+                    self._dropped += 1
+                index += 1
+
+            if batch.count == 0:
+                if index >= len(pending):
+                    break
+                # a single item larger than the batch buffer can never be sent
+                index += 1
+                self._dropped += 1
+                continue
+
+            try:
+                retry, held = self._send(requests, batch.end(), batch.count)
+            except Exception as ex:
+                # the items are queued again like after a failed request
+                print("Telemetry exporter failed: ", ex)
+                self._backoff(None)
+                retry, held = range(batch.count), ()
+            for i in held:
+                if appended[i] < queued:
+                    self._enqueue(pending[appended[i]])
+            if len(retry) > 0:
+                # queue what was not delivered and try again after the backoff,
+                # the dropped counter is simply reported again next time
+                for i in retry:
+                    if appended[i] < queued:
+                        self._enqueue(pending[appended[i]])
+                for item in pending[index:queued]:
+                    self._enqueue(item)
+                return
+
+        self._dropped -= dropped
+
+    async def replay_spool(self, requests: requests.Session):
+        """ Upload one batch of spooled items, schedule this periodically to drain the spool after an outage """
+        if not self.spooled or self.backingOff:
+            return
+
+        batch = self._batch
+        records = self._spool.read(self._replayBatch, batch.size - self._replayBatch - 1)
+        batch.begin()
+        for record in records:
+            if not batch.append(self._writeRecord, record):
+                break
+        if batch.count == 0:
+            if len(records) > 0:
+                # a record that doesn't fit in an empty batch can never be sent, e.g. spooled with a larger batch_size
+                self._spool.commit(records[:1])
+                self._dropped += 1
+            return
+
+        try:
+            retry, held = self._send(requests, batch.end(), batch.count)
+        except Exception as ex:
+            # e.g. records spooled by another kind of exporter, they would fail every replay
+            print("Spooled telemetry can't be sent: ", ex)
+            self._spool.commit(records[:batch.count])
+            self._dropped += batch.count
+            return
+        if len(retry) == batch.count:
+            # nothing delivered, the records are read again on the next attempt
+            return
+
+        # held records go to the end of the spool so the ones behind them are replayed
+        sent = records[:batch.count]
+        for indexes in (retry, held):
+            for i in indexes:
+                if not self._spool.append(sent[i]):
+                    self._dropped += 1
+        self._spool.commit(sent)
+
+    @property
+    def backingOff(self) -> bool:
+        """ True while uploads are suspended after throttling or a failed upload """
+        return time.monotonic() < self._retryAt
+
+    @staticmethod
+    def _writeRecord(record:bytes, stream):
+        stream.write(record)
+
+    def _send(self, requests, payload:memoryview, count:int):
+        """ Hand a batch of count items to the exporter
+        Returns the indexes of the items that must be sent again after the backoff and of those held back by the exporter.
+        """
+        retry, rejected, retryAfter, held = self._exporter.send(self, requests, payload, count)
+        self._dropped += rejected
+        if len(retry) > 0:
+            self._backoff(retryAfter)
+        else:
+            self._failures = 0
+        return retry, held
+
+    def _backoff(self, retryAfter:str):
+        self._failures += 1
+        delay = None
+        if retryAfter is not None:
+            try:
+                delay = int(retryAfter)
+            except ValueError:
+                pass
+        if delay is None:
+            # exponential backoff with jitter
+            delay = min(self._maxBackoff, self._minBackoff * 2 ** (self._failures - 1))
+            delay = delay / 2 + random.random() * delay / 2
+        self._retryAt = time.monotonic() + delay
 
 ## Relevant info in the AI Javascript SDK
 ## https://github.com/microsoft/ApplicationInsights-JS/blob/master/shared/AppInsightsCommon/src/Interfaces/PartAExtensions.ts
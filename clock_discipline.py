@@ -0,0 +1,62 @@
+import time
+
+# Keeps the DS3231 in step with NTP and adapts how often that is needed
+#
+# Every sync measures how far the RTC drifted since it was last set. While the RTC stays within the tolerance the poll
+# interval doubles up to max_interval, when it drifted further the interval halves down to min_interval.
+# Optionally the measured drift is corrected with the aging offset register of the DS3231, one step is about 0.1 ppm.
+#
+# The RTC only keeps whole seconds, so it's read half way through a UTC second and set at the start of one. That puts
+# the resolution of a single measurement at half a second, the aging offset is only adjusted when the drift is large
+# enough to be measured reliably.
+
+# Aging offset change that corresponds to 1 ppm, positive values slow the oscillator down
+_AGING_STEPS_PER_PPM = 10
+
+
+class ClockDiscipline:
+    def __init__(self, rtc, ntp, *, min_interval:int=3600, max_interval:int=7*86400, initial_interval:int=86400, tolerance:float=1, adjust_aging:bool=False):
+        self._rtc = rtc
+        self._ntp = ntp
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = initial_interval
+        self._tolerance = tolerance
+        self._adjustAging = adjust_aging
+        # UTC seconds when the RTC was last set
+        self._lastSet = None
+        # RTC minus UTC in whole seconds at the last sync
+        self.offset = None
+        # measured drift of the RTC in ppm, positive when it runs fast
+        self.drift = None
+
+    async def sync(self, sleep) -> int:
+        """ Measure the RTC against NTP, set it and return the number of seconds until the next sync """
+        ntp = self._ntp
+        await ntp.sync_async(sleep)
+        # clock_ns from here on, utc_ns and datetime could start a blocking sync when the server asked for a short poll
+
+        # read the RTC half way through a UTC second, its whole seconds are then off by less than half a second
+        await sleep(((1_500_000_000 - ntp.clock_ns % 1_000_000_000) % 1_000_000_000) / 1_000_000_000)
+        utc = ntp.clock_ns // 1_000_000_000
+        self.offset = time.mktime(self._rtc.datetime) - utc
+
+        if self._lastSet is not None and utc > self._lastSet:
+            self.drift = self.offset / (utc - self._lastSet) * 1_000_000
+            if abs(self.offset) > self._tolerance:
+                self.interval = max(self.min_interval, self.interval // 2)
+            else:
+                self.interval = min(self.max_interval, self.interval * 2)
+            if self._adjustAging and abs(self.offset) >= 2:
+                self._correctAging(self.drift)
+
+        # set it right at the start of the next second
+        await sleep((1_000_000_000 - ntp.clock_ns % 1_000_000_000) / 1_000_000_000)
+        utc = ntp.clock_ns // 1_000_000_000
+        self._rtc.datetime = time.localtime(utc)
+        self._lastSet = utc
+        return self.interval
+
+    def _correctAging(self, drift:float):
+        calibration = self._rtc.calibration + round(drift * _AGING_STEPS_PER_PPM)
+        self._rtc.calibration = max(-128, min(127, calibration))
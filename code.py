@@ -1,6 +1,10 @@
 from ringbuffer import RingBuffer
+from history import Series
+from array import array
+from json_extract import extract
+from http_cache import HttpCache, FRESH
 import time
-from adafruit_datetime import datetime, time
+from adafruit_datetime import time
 import board
 import busio
 # Network
@@ -8,26 +12,36 @@ import wifi
 import ssl
 import socketpool
 import adafruit_ntp
-import adafruit_requests as requests
+from clock_discipline import ClockDiscipline
+from software_clock import SoftwareClock
+from connection_pool import PooledSession
+from wifi_supervisor import WifiSupervisor, WifiState
+from task_monitor import TaskMonitor
 from timezone_amsterdam import TimeZoneAmsterdam
 # Display
 import displayio
 import terminalio
 from adafruit_bitmap_font import bitmap_font
+import subset_font
 from adafruit_display_text import label
 from adafruit_st7789 import ST7789
 # Board
 import feathers2
 import analogio
+import keypad
 import adafruit_dotstar
 # Sensor
 import adafruit_bme680
-from adafruit_io.adafruit_io import IO_HTTP, AdafruitIO_RequestError
 import adafruit_apds9960.apds9960
 from adafruit_apds9960 import colorutility
+from sensor_hub import SensorHub
+from gesture_input import GestureInput, GESTURE_UP, GESTURE_DOWN, GESTURE_LEFT, GESTURE_RIGHT
 
 # Telemetry
-from application_insights import Telemetry, Severity
+from application_insights import Telemetry, Severity, Overflow, MqttExporter, AdafruitIOExporter
+from feed_registry import FeedRegistry
+import adafruit_minimqtt.adafruit_minimqtt as MQTT
+from spool import Spool
 
 # Async
 import asynccp
@@ -46,7 +60,6 @@ dotstar = adafruit_dotstar.DotStar(board.APA102_SCK, board.APA102_MOSI, 1, brigh
 
 # Clock
 import adafruit_ds3231
-from time import struct_time
 
 from secrets import secrets
 
@@ -70,6 +83,19 @@ def setupDisplay():
     return ST7789(display_bus, width=320, height=240, rotation=90, backlight_pin=board.D17)
     
 
+def loadFont(name):
+    # prefer the glyph subset built by tools/build_fonts.py, it loads in one pass
+    try:
+        return subset_font.load_font("/" + name + ".subset")
+    except OSError:
+        return bitmap_font.load_font("/" + name + ".bdf")
+
+
+PAGE_CLOCK = 0
+PAGE_HISTORY = 1
+CHART_WIDTH = 288
+CHART_HEIGHT = 80
+
 class NightwatchUI:
 
   months = ["januari", "februari", "maart", "april", "mei", "juni", "juli", "augustus", "september", "oktober", "november", "december"]
@@ -78,8 +104,8 @@ class NightwatchUI:
   def __init__(self,display): 
         self.sunUp = True
         self.display = display
-        self.font60 = bitmap_font.load_font("/NotoSans-Bold-60.bdf") #terminalio.FONT
-        self.font24 = bitmap_font.load_font("/NotoSans-Bold-24.bdf") #terminalio.FONT
+        self.font60 = loadFont("NotoSans-Bold-60") #terminalio.FONT
+        self.font24 = loadFont("NotoSans-Bold-24") #terminalio.FONT
 
         self.splash = displayio.Group()
         text_group = displayio.Group()
@@ -101,24 +127,142 @@ class NightwatchUI:
         self.splash.append(self.ambient)
         display.show(self.splash)
 
+        # second page with the history of the ambient temperature and humidity
+        self.page = PAGE_CLOCK
+        self.historyPage = displayio.Group()
+        self.historyTitle = label.Label(terminalio.FONT, scale=2, text="                ", color=0xFFFFFF)
+        self.historyTitle.x = 16
+        self.historyTitle.y = 12
+        self.temperatureRange = label.Label(terminalio.FONT, scale=1, text="                    ", color=0xFFFF00)
+        self.temperatureRange.x = 16
+        self.temperatureRange.y = 34
+        self.humidityRange = label.Label(terminalio.FONT, scale=1, text="                    ", color=0x00FFFF)
+        self.humidityRange.x = 16
+        self.humidityRange.y = 140
+        self.temperatureChart = self._chart(0xFFFF00, 44)
+        self.humidityChart = self._chart(0x00FFFF, 150)
+        self.historyPage.append(self.historyTitle)
+        self.historyPage.append(self.temperatureRange)
+        self.historyPage.append(self.humidityRange)
+        # values of one chart, reused for every render
+        self._chartValues = array('f', [0.0] * CHART_WIDTH)
+
+        # labels are only touched when their content changes and all changes go out in a single refresh
+        display.auto_refresh = False
+        self._dirty = True
+        # centred x position per rendered string
+        self._timeX = {}
+        self._dateX = {}
+        self.refresh()
+
  
   #user defined function of class
   def renderTime( self, now ):
     
-    self.time.color = 0xFFFFFF if self.sunUp else 0xFFFF00
+    self._setColor(self.time, 0xFFFFFF if self.sunUp else 0xFFFF00)
     
-    self.time.text = '{:02}:{:02}'.format(now.tm_hour, now.tm_min)
-    (_, _, width, _) = self.time.bounding_box
-    self.time.x = self.display.width // 2 - width // 2
-    self.date.text = '{} {}'.format(now.tm_mday, self.months[now.tm_mon-1])
-    (_, _, width, _) = self.date.bounding_box
-    self.date.x = self.display.width // 2 - width // 2
+    if self._setText(self.time, '{:02}:{:02}'.format(now.tm_hour, now.tm_min)):
+      self._center(self.time, self._timeX)
+    if self._setText(self.date, '{} {}'.format(now.tm_mday, self.months[now.tm_mon-1])):
+      self._center(self.date, self._dateX)
+    self.refresh()
 
   def renderWeather( self, report ):
-       self.weather.text = report
+       self._setText(self.weather, report)
+       self.refresh()
 
   def renderAmbient( self, temperature, humidity ):
-       self.ambient.text = '{:.1f}C {:.1f}%'.format(temperature, humidity)
+       self._setText(self.ambient, '{:.1f}C {:.1f}%'.format(temperature, humidity))
+       self.refresh()
+
+  def showPage( self, page ):
+    if page == self.page:
+      return
+    self.page = page
+    self.display.show(self.historyPage if page == PAGE_HISTORY else self.splash)
+    self._dirty = True
+    self.refresh()
+
+  def renderHistory( self, title, temperature, humidity ):
+    self._setText(self.historyTitle, title)
+    extent = self._drawChart(self.temperatureChart, temperature)
+    self._setText(self.temperatureRange, '{:.1f} - {:.1f}C'.format(extent[0], extent[1]) if extent else '')
+    extent = self._drawChart(self.humidityChart, humidity)
+    self._setText(self.humidityRange, '{:.0f} - {:.0f}%'.format(extent[0], extent[1]) if extent else '')
+    self._dirty = True
+    self.refresh()
+
+  def _chart( self, color, y ):
+    palette = displayio.Palette(2)
+    palette[0] = 0x000000
+    palette[1] = color
+    bitmap = displayio.Bitmap(CHART_WIDTH, CHART_HEIGHT, 2)
+    self.historyPage.append(displayio.TileGrid(bitmap, pixel_shader=palette, x=16, y=y))
+    return bitmap
+
+  def _drawChart( self, bitmap, tier ):
+    # sparkline of the bucket means, the newest bucket on the right
+    bitmap.fill(0)
+    values = self._chartValues
+    count = tier.read_into(values)
+    extent = tier.extent(count)
+    if extent is None:
+      return None
+    # scale to the means so the line uses the full height, the extent is the range of all samples
+    low = extent[1]
+    high = extent[0]
+    for i in range(count):
+      value = values[i]
+      if value == value:
+        if value < low:
+          low = value
+        if value > high:
+          high = value
+    scale = (CHART_HEIGHT - 1) / (high - low) if high > low else 0
+    offset = tier.size - count
+    previous = -1
+    for i in range(count):
+      value = values[i]
+      if value != value:
+        # no samples in this bucket
+        previous = -1
+        continue
+      x = (offset + i) * CHART_WIDTH // tier.size
+      y = CHART_HEIGHT - 1 - int((value - low) * scale)
+      top = y if previous < 0 or y < previous else previous
+      bottom = y if previous < 0 or y > previous else previous
+      for row in range(top, bottom + 1):
+        # flat index, a tuple index would allocate for every pixel
+        bitmap[row * CHART_WIDTH + x] = 1
+      previous = y
+    return extent
+
+  def refresh( self ):
+    if self._dirty:
+      self.display.refresh()
+      self._dirty = False
+
+  def _setText( self, label, text ):
+    if label.text == text:
+      return False
+    label.text = text
+    self._dirty = True
+    return True
+
+  def _setColor( self, label, color ):
+    if label.color != color:
+      label.color = color
+      self._dirty = True
+
+  def _center( self, label, positions ):
+    x = positions.get(label.text)
+    if x is None:
+      (_, _, width, _) = label.bounding_box
+      x = self.display.width // 2 - width // 2
+      if len(positions) >= 16:
+        positions.clear()
+      positions[label.text] = x
+    label.x = x
 
 def setupClock():
     # configure i2c
@@ -126,6 +270,26 @@ def setupClock():
     ### clock
     return adafruit_ds3231.DS3231(i2c)
 
+NTP_SERVERS = ("0.pool.ntp.org", "1.pool.ntp.org", "2.pool.ntp.org")
+
+# metrics sent to Adafruit IO and their feeds
+AIO_FEEDS = {"ambient.temperature": "ambient-temperature", "ambient.humidity": "ambient-humidity"}
+
+# fields used from the weather report, the rest of the document is skipped while reading
+WEATHER_CONDITION = ("liveweer", 0, "samenv")
+WEATHER_TEMPERATURE = ("liveweer", 0, "temp")
+WEATHER_SUNRISE = ("liveweer", 0, "sup")
+WEATHER_SUNSET = ("liveweer", 0, "sunder")
+WEATHER_FIELDS = (WEATHER_CONDITION, WEATHER_TEMPERATURE, WEATHER_SUNRISE, WEATHER_SUNSET)
+
+def extractWeather(response):
+    "Condition, temperature, sunrise and sunset from the weather report"
+    report = extract(response.iter_content(chunk_size=64), WEATHER_FIELDS)
+    return [report[field] for field in WEATHER_FIELDS]
+
+# the tiers of history.DEFAULT_TIERS
+HISTORY_TITLES = ("Laatste uur", "Laatste 24 uur", "Laatste week")
+
 STATUS_NO_CONNECTION = (100, 100, 0)
 STATUS_CONNECTING = (0, 0, 100)
 STATUS_FETCHING = (200, 100, 0)
@@ -142,36 +306,65 @@ class Application:
         self.rtc = adafruit_ds3231.DS3231(i2c)
         now = self.rtc.datetime
         printDateTime("RTC reports UTC is ", now)
+        # tells the time without reading the RTC over I2C every time
+        self.clock = SoftwareClock(self.rtc, localTimeZone)
         self.environmentalSensor = adafruit_bme680.Adafruit_BME680_I2C(i2c, refresh_rate=1)
-        print('Ambient temperature: {} °C'.format(self.environmentalSensor.temperature))
         self.lightSensor = adafruit_apds9960.apds9960.APDS9960(i2c)
-        self.lightSensor.enable_proximity = True
-        self.lightSensor.enable_gesture = True
         self.lightSensor.enable_color = True
+        # one read per device per cycle, shared by the UI, the brightness control and telemetry
+        self.sensors = SensorHub(self.environmentalSensor, self.lightSensor, environment_max_age=1, light_max_age=1)
+        self.reportedSaved = 0
+        print('Ambient temperature: {} °C'.format(self.sensors.environment().temperature))
         # https://github.com/adafruit/Adafruit_CircuitPython_APDS9960/blob/main/examples/apds9960_proximity_simpletest.py
-        # int_pin = digitalio.DigitalInOut(board.D5) # TODO connect the interrupt line and pick the port
-        # self.lightSensor.proximity_interrupt_threshold = (0, 175)
-        # self.lightSensor.enable_proximity_interrupt = True
+        # the INT line of the sensor is connected to D5, it's open drain and active low
+        self.gestureInterrupt = keypad.Keys((board.D5,), value_when_pressed=False, pull=True)
+        self.gestures = GestureInput(self.lightSensor, self.gestureInterrupt)
+        for gesture in (GESTURE_UP, GESTURE_DOWN, GESTURE_LEFT, GESTURE_RIGHT):
+            self.gestures.add_handler(gesture, self.handleGesture)
         # Create a reference to the ambient light sensor so we can read it's value
         self.brightnessReadings = RingBuffer(20)
+        # last hour, day and week of the ambient readings for the history page
+        self.temperatureHistory = Series()
+        self.humidityHistory = Series()
+        self.historyTier = 0
         self.light = analogio.AnalogIn(board.AMB)
         self.status = STATUS_NO_CONNECTION
-        self.connected = False
-        self.telemetry = Telemetry(secrets['ai_key'], secrets['ai_url'], debug=True)
+        self.wifi = WifiSupervisor(wifi.radio, secrets["ssid"], secrets["password"])
+        self.wifi.add_listener(self._wifiStateChanged)
+        self.pool = socketpool.SocketPool(wifi.radio)
+        # keeps sockets to the weather and telemetry hosts open between requests
+        self.https = PooledSession(self.pool, ssl.create_default_context())
+        self.mqtt = None
+        self.feeds = None
+        # telemetry goes to Application Insights unless the secrets select another sink
+        sink = secrets.get('telemetry', 'ai')
+        # spooled records are in the format of the sink, every sink has its own spool
+        self.telemetry = Telemetry(secrets.get('ai_key'), secrets.get('ai_url'), debug=True, overflow=Overflow.KeepLatestPerMetric, aggregate_metrics=True, spool=Spool('/telemetry-' + sink + '.spool'), exporter=self._createExporter(sink), clock=self.clock.isoformat)
+        # the last weather report survives a reboot, the source updates less often than it's polled
+        self.httpCache = HttpCache('/http.cache', clock=self.clock.seconds)
+        # run time, lateness and blocking time of the scheduled tasks
+        self.tasks = TaskMonitor()
 
     async def sampleEnvironment(self):
-        self.ambientTemperature = self.environmentalSensor.temperature
-        self.ambientHumidity = self.environmentalSensor.humidity
+        environment = self.sensors.environment()
+        self.ambientTemperature = environment.temperature
+        self.ambientHumidity = environment.humidity
         self.ui.renderAmbient(self.ambientTemperature, self.ambientHumidity)
+        now = self.clock.seconds()
+        self.temperatureHistory.add(self.ambientTemperature, now)
+        self.humidityHistory.add(self.ambientHumidity, now)
+        if self.ui.page == PAGE_HISTORY:
+            self.renderHistory()
         
-        timestamp = self.utcnow().isoformat()
+        timestamp = self.clock.isoformat()
         self.telemetry.metric('ambient.temperature', self.ambientTemperature, timestamp=timestamp)
         self.telemetry.metric('ambient.humidity', self.ambientHumidity, timestamp=timestamp)
-        self.telemetry.metric('ambient.pressure', self.environmentalSensor.pressure, timestamp=timestamp)
-        self.telemetry.metric('ambient.light', self.lightSensor.color_data[3], timestamp=timestamp)
-        #if( self.connected ):
-        #    self.io.send_data("ambient-temperature", self.ambientTemperature)
-        #    self.io.send_data("ambient-humidity", self.ambientTemperature)
+        self.telemetry.metric('ambient.pressure', environment.pressure, timestamp=timestamp)
+        self.telemetry.metric('ambient.light', self.sensors.light().clear, timestamp=timestamp)
+        # saved is a running total, metrics are summed per upload window
+        saved = self.sensors.saved
+        self.telemetry.metric('sensors.savedTransactions', saved - self.reportedSaved, timestamp=timestamp)
+        self.reportedSaved = saved
 
     async def sampleAmbientLight(self):
         #any value of 20k => 100%
@@ -180,7 +373,8 @@ class Application:
         #    self.brightnessReadings.append( 1.0 )
         #else:
         #    self.brightnessReadings.append(((light - 516) / 19484 * 0.99) +0.01)
-        r, g, b, c =  self.lightSensor.color_data
+        # sampled three times a second, the sensor is read at most once a second
+        c = self.sensors.light().clear
         if( c >= 20000 ):
             self.brightnessReadings.append( 1.0 )
         else:
@@ -188,8 +382,9 @@ class Application:
         
 
     async def adjustBrightness(self):
-        buffer = self.brightnessReadings.get()
-        avg = sum(buffer)/len(buffer)
+        if len(self.brightnessReadings) == 0:
+            return
+        avg = self.brightnessReadings.mean
         # clamp
         if( avg <= 0 ):
             avg = 0.01
@@ -223,77 +418,116 @@ class Application:
             else:
                 await asynccp.delay(seconds=0.5)
 
-    # connect to wifi
-    async def connectWifi(self):
-        print("Connecting to wifi")
-        self.status=STATUS_CONNECTING
-        while not wifi.radio.ap_info:
-            try:
-                wifi.radio.connect(secrets["ssid"], secrets["password"])
-            except Exception as e:
-                print("Could not connect to AP, retrying: ", e)
-                await asynccp.delay(seconds=0.5)
-                continue
-        
-        print("Connected, IP {0}.".format(wifi.radio.ipv4_address))
-        self.pool = socketpool.SocketPool(wifi.radio)
-        self.https = requests.Session(self.pool, ssl.create_default_context())
-        self.status=STATUS_CONNECTED
-        self.connected=True
-        #self._setupAdafruitIO()
-        return self.pool
+    def _wifiStateChanged(self, state):
+        if state == WifiState.Connected:
+            print("Connected, IP {0}.".format(wifi.radio.ipv4_address))
+            self.status = STATUS_CONNECTED
+        elif state == WifiState.Connecting:
+            self.status = STATUS_CONNECTING
+        else:
+            if state == WifiState.Disconnected:
+                print("Wifi connection was dropped")
+                # sockets opened over the lost link are dead
+                self.https.close()
+                if self.mqtt is not None:
+                    self.mqtt.close()
+            elif self.wifi.lastError is not None:
+                print("Could not connect to AP, retrying: ", self.wifi.lastError)
+            self.status = STATUS_NO_CONNECTION
+
+    def _createExporter(self, sink:str):
+        if sink == 'mqtt':
+            # one connection for the lifetime of the application, kept open by keepTelemetryAlive
+            client = MQTT.MQTT(secrets['mqtt_broker'], port=secrets.get('mqtt_port', 8883),
+                               username=secrets.get('mqtt_username'), password=secrets.get('mqtt_password'),
+                               socket_pool=self.pool, ssl_context=ssl.create_default_context())
+            self.mqtt = MqttExporter(client, secrets.get('mqtt_topic', 'roomy/telemetry'))
+            return self.mqtt
+        if sink == 'aio':
+            # feeds that were resolved before are used right away, new ones are created by resolveFeeds
+            self.feeds = FeedRegistry(secrets["aio_username"], secrets["aio_key"], '/aio.feeds', clock=self.clock.seconds)
+            return AdafruitIOExporter(secrets["aio_username"], secrets["aio_key"], feeds=AIO_FEEDS, registry=self.feeds)
+        return None
+
+    async def keepTelemetryAlive(self):
+        if self.mqtt is not None and self.wifi.connected:
+            self.mqtt.maintain()
+
+    async def resolveFeeds(self):
+        if self.feeds is None or not self.wifi.connected or not self.feeds.pending:
+            return
+
+        await self.feeds.resolve(self.https)
 
     def utcnow(self):
-        return to_datetime(self.rtc.datetime)
+        return self.clock.utcnow()
 
     async def uploadTelemetry(self):
-        self.telemetry.trace('Ping', Severity.Information, timestamp = self.utcnow().isoformat())
+        self.telemetry.trace('Ping', Severity.Information, timestamp = self.clock.isoformat())
 
-        if not self.connected:
+        if not self.wifi.connected:
+            # keep it on flash instead of RAM until we're online
+            self.telemetry.offload()
             return
         
+        timestamp = self.clock.isoformat()
+        self.telemetry.metric('http.handshakeMs', self.https.averageHandshakeMs, timestamp=timestamp)
+        self.telemetry.metric('http.socketHits', self.https.hits, timestamp=timestamp)
+        self.telemetry.metric('http.socketMisses', self.https.misses, timestamp=timestamp)
+        self.tasks.report(self.telemetry, timestamp)
         await self.telemetry.upload_telemetry(self.https)
 
-    def _setupAdafruitIO(self):
-        self.io = IO_HTTP(secrets["aio_username"], secrets["aio_key"], self.https)
-        try:
-            ambient_t_feed = self.io.get_feed("ambient-temperature")
-        except AdafruitIO_RequestError:
-            ambient_t_feed = self.io.create_new_feed("ambient-temperature")
+    async def replayTelemetry(self):
+        if not self.wifi.connected or not self.telemetry.spooled:
+            return
 
-        try:
-            ambient_h_feed = self.io.get_feed("ambient-humidity")
-        except AdafruitIO_RequestError:
-            ambient_h_feed = self.io.create_new_feed("ambient-humidity")
+        await self.telemetry.replay_spool(self.https)
 
     async def syncWithNtp(self):
-        if( not self.connected ):
-            await asynccp.delay(Duration.of_minutes(15))
-
-        try:
-            print("Sync time with NTP")
-            ntp = adafruit_ntp.NTP(self.pool)   
-            # set the time from ntp - this is UTC
-            self.rtc.datetime = ntp.datetime
-        
-            printDateTime("RTC set to : ", self.rtc.datetime)
-            await asynccp.delay(Duration.of_hours(24))
-        except Exception as ex:
-            print('Weather API failed, retrying on the next run')
-            self.telemetry.exception(ex, Severity.Information, timestamp = self.utcnow().isoformat())
-            traceback.print_exception(ex, ex, ex.__traceback__)
-
-    async def handleGesture(self):
-        gesture = self.lightSensor.gesture()
+        # kept for the lifetime of the application, it learns how fast the RTC drifts
+        ntp = adafruit_ntp.NTP(self.pool, servers=NTP_SERVERS, samples=2)
+        clock = ClockDiscipline(self.rtc, ntp, adjust_aging=True)
+        while True:
+            await self.wifi.wait_connected()
+            try:
+                print("Sync time with NTP")
+                # don't block the other tasks while waiting for the replies
+                await clock.sync(asynccp.delay)
+                self.clock.set(ntp.clock_ns)
+                printDateTime("RTC set to : ", self.rtc.datetime)
+                print("RTC was off by {} s, drift {} ppm, next sync in {} s".format(clock.offset, clock.drift, clock.interval))
+                timestamp = self.clock.isoformat()
+                self.telemetry.metric('clock.offset', clock.offset, timestamp=timestamp)
+                if clock.drift is not None:
+                    self.telemetry.metric('clock.drift', clock.drift, timestamp=timestamp)
+                delay = clock.interval
+            except Exception as ex:
+                print('NTP sync failed, retrying in 15 minutes')
+                self.telemetry.exception(ex, Severity.Information, timestamp = self.clock.isoformat())
+                traceback.print_exception(ex, ex, ex.__traceback__)
+                delay = Duration.of_minutes(15)
+            await asynccp.delay(delay)
 
-        if gesture == 0x01:
+    def handleGesture(self, gesture):
+        if gesture == GESTURE_UP:
             print("up")
-        elif gesture == 0x02:
+            # longer period
+            self.historyTier = min(self.historyTier + 1, len(HISTORY_TITLES) - 1)
+        elif gesture == GESTURE_DOWN:
             print("down")
-        elif gesture == 0x03:
+            self.historyTier = max(self.historyTier - 1, 0)
+        elif gesture == GESTURE_LEFT:
             print("left")
-        elif gesture == 0x04:
+            self.ui.showPage(PAGE_HISTORY)
+        elif gesture == GESTURE_RIGHT:
             print("right")
+            self.ui.showPage(PAGE_CLOCK)
+        if self.ui.page == PAGE_HISTORY:
+            self.renderHistory()
+
+    def renderHistory(self):
+        tier = self.historyTier
+        self.ui.renderHistory(HISTORY_TITLES[tier], self.temperatureHistory.tiers[tier], self.humidityHistory.tiers[tier])
 
         # r, g, b, c =  self.lightSenso.color_data
         # print("red: ", r)
@@ -307,68 +541,55 @@ class Application:
     async def updateTime(self):
         while True:
             try:
-                current = toLocalDateTime( self.rtc.datetime ).timetuple()
+                current = self.clock.localnow().timetuple()
                 printDateTime("The current time is: ", current)
                 ui.renderTime(current)           
             except Exception as ex:
                 print('updateTime failed')
-                self.telemetry.exception(ex, Severity.Information, timestamp = self.utcnow().isoformat())
+                self.telemetry.exception(ex, Severity.Information, timestamp = self.clock.isoformat())
                 traceback.print_exception(ex, ex, ex.__traceback__)
             finally:
-                await asynccp.delay(seconds=60-self.rtc.datetime.tm_sec) # sleep the rest of the minute  
+                await asynccp.delay(seconds=60-self.clock.utc_ns() % 60_000_000_000 / 1_000_000_000) # sleep the rest of the minute  
 
     async def updateWeather(self):
-        while( not self.connected ):
-            print('Waiting for wifi to connect')
-            await asynccp.delay(seconds=5)
+        await self.wifi.wait_connected()
 
         try:
             self.status = STATUS_FETCHING
-            with self.https.get(secrets['weather_api']) as response:
-                if response.status_code != 200:
-                    print("Weather API response is {}".format(response.status_code))
-                    self.status = STATUS_FAILED
-                else:
+            status, weather = self.httpCache.get(self.https, secrets['weather_api'], extractWeather)
+            gc.collect()
+            if weather is None:
+                print("Weather API response is {}".format(status))
+                self.status = STATUS_FAILED
+            else:
+                if status != FRESH:
                     self.status = STATUS_DATA_RECEIVED
-                    report = response.json()
-                    try:
-                        print('{} {}°C '.format(report['liveweer'][0]['samenv'], report['liveweer'][0]['temp']))
-                        ui.renderWeather( '{} {}'.format(report['liveweer'][0]['samenv'], report['liveweer'][0]['temp']))
-                        # sup en sunder => zon op / onder
-                        sunUp = time.fromisoformat(report['liveweer'][0]['sup'])
-                        sunUnder = time.fromisoformat(report['liveweer'][0]['sunder'])
-                        now = toLocalDateTime( self.rtc.datetime )
-                        sunIsUp = sunUp<now.time() and sunUnder>now.time()
-                        if( ui.sunUp != sunIsUp ):
-                            print('Sun is ', 'up' if sunIsUp else 'under')
-                            ui.sunUp = sunIsUp
-                    finally:
-                        # see https://learn.adafruit.com/oshwa-project-display-with-adafruit-magtag/code-the-project-display
-                        report.clear()
-                        report = None
-                        response.close()
-                        gc.collect()
-                
+                condition, temperature, sunrise, sunset = weather
+                print('{} {}°C '.format(condition, temperature))
+                ui.renderWeather( '{} {}'.format(condition, temperature))
+                # sup en sunder => zon op / onder
+                sunUp = time.fromisoformat(sunrise)
+                sunUnder = time.fromisoformat(sunset)
+                now = self.clock.localnow()
+                sunIsUp = sunUp<now.time() and sunUnder>now.time()
+                if( ui.sunUp != sunIsUp ):
+                    print('Sun is ', 'up' if sunIsUp else 'under')
+                    ui.sunUp = sunIsUp
+
             # d0weer d0tmin d0tmax => Vandaag {weer} {min} tot {max} graden
         except Exception as ex:
             print('Weather API failed, retrying on the next run')
-            self.telemetry.exception(ex, Severity.Information, timestamp = self.utcnow().isoformat())
+            self.telemetry.exception(ex, Severity.Information, timestamp = self.clock.isoformat())
             traceback.print_exception(ex, ex, ex.__traceback__)
-            if( not wifi.radio.ap_info ):
-                print('Wifi connection was dropped')
+            self.wifi.link_lost()
             
 
 def printDateTime( str, current ):
     "Write the current date and time"
     print('{} {}/{}/{} {:02}:{:02}:{:02}'.format(str, current.tm_mday, current.tm_mon, current.tm_year, current.tm_hour, current.tm_min, current.tm_sec))
 
-def to_datetime(current:struct_time) -> datetime:
-    return datetime(current.tm_year, current.tm_mon, current.tm_mday, current.tm_hour, current.tm_min, current.tm_sec)
-
-def toLocalDateTime(current:struct_time) -> datetime:
-    utc = to_datetime(current)
-    now = TimeZoneAmsterdam().fromutc(utc)
-    return now
+# shared so the cached DST interval is reused
+localTimeZone = TimeZoneAmsterdam()
 
 display = setupDisplay()
 display.auto_brightness = False
@@ -377,15 +598,21 @@ display.brightness = 1
 ui = NightwatchUI(display)
 app = Application(ui)
 
-asynccp.add_task(app.updateTime())
-asynccp.add_task(app.updateStatusLed())
-asynccp.schedule(frequency=Duration.of_minutes(5), coroutine_function=app.updateWeather)
-asynccp.run_later(0.5, app.connectWifi())
-asynccp.schedule_later(hz=Duration.of_hours(24), coroutine_function=app.syncWithNtp)
-asynccp.schedule(frequency=3, coroutine_function=app.sampleAmbientLight)
-asynccp.schedule(frequency=0.5, coroutine_function=app.adjustBrightness)
-asynccp.schedule(frequency=10, coroutine_function=app.handleGesture)
-asynccp.schedule(frequency=Duration.of_seconds(30), coroutine_function=app.sampleEnvironment)
-asynccp.schedule(frequency=Duration.of_minutes(5), coroutine_function=app.uploadTelemetry)
+app.tasks.add_task('updateTime', app.updateTime())
+app.tasks.add_task('updateStatusLed', app.updateStatusLed())
+app.tasks.schedule('updateWeather', Duration.of_minutes(5), app.updateWeather)
+app.tasks.run_later('wifi', 0.5, app.wifi.run())
+app.tasks.add_task('syncWithNtp', app.syncWithNtp())
+app.tasks.schedule('sampleAmbientLight', 3, app.sampleAmbientLight)
+app.tasks.schedule('adjustBrightness', 0.5, app.adjustBrightness)
+# only reads the sensor when its interrupt is pending
+app.tasks.schedule('gestures', 10, app.gestures.poll)
+app.tasks.schedule('sampleEnvironment', Duration.of_seconds(30), app.sampleEnvironment)
+app.tasks.schedule('uploadTelemetry', Duration.of_minutes(5), app.uploadTelemetry)
+app.tasks.schedule('replayTelemetry', Duration.of_seconds(20), app.replayTelemetry)
+if app.mqtt is not None:
+    app.tasks.schedule('keepTelemetryAlive', Duration.of_seconds(10), app.keepTelemetryAlive)
+if app.feeds is not None:
+    app.tasks.schedule('resolveFeeds', Duration.of_seconds(10), app.resolveFeeds)
 feathers2.led_set(False)
 asynccp.run()
\ No newline at end of file
@@ -0,0 +1,114 @@
+import time
+import adafruit_requests as requests
+
+# Bounded keep-alive socket pool with TLS session resumption
+#
+# adafruit_requests.Session already keeps one socket per (host, port, protocol), but never closes an idle one, so a
+# socket the server dropped long ago is only found out when a request on it fails and has to be sent again. The
+# pooled session closes idle sockets that are older than max_idle before reusing them and closes the least recently
+# used idle socket when max_sockets are open, every TLS socket holds buffers of several kB on the ESP32-S2.
+#
+# New TLS connections offer the session of the last connection to the same host, a resumed handshake skips the
+# certificate exchange. This needs an ssl module with SSLContext.wrap_socket(session=) and SSLSocket.session like
+# CPython's; CircuitPython doesn't have it (yet), there every handshake is a full one and only keep-alive helps.
+
+
+class _ResumingContext:
+    """ SSL context proxy that offers the last TLS session per host when wrapping a socket """
+    def __init__(self, context):
+        self._context = context
+        self.sessions = {}
+        self.supported = True
+
+    def wrap_socket(self, sock, server_hostname=None, **kwargs):
+        session = self.sessions.get(server_hostname)
+        if self.supported and session is not None:
+            try:
+                return self._context.wrap_socket(sock, server_hostname=server_hostname, session=session, **kwargs)
+            except TypeError:
+                self.supported = False
+        return self._context.wrap_socket(sock, server_hostname=server_hostname, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+class PooledSession(requests.Session):
+    def __init__(self, socket_pool, ssl_context=None, *, max_sockets:int=3, max_idle:int=30):
+        self._resuming = _ResumingContext(ssl_context) if ssl_context is not None else None
+        super().__init__(socket_pool, self._resuming)
+        self._maxSockets = max_sockets
+        self._maxIdleNs = max_idle * 1_000_000_000
+        # monotonic time at which each idle socket was freed
+        self._idleSince = {}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.handshakes = 0
+        self.handshakeMs = 0
+        self.resumed = 0
+
+    def _get_socket(self, host, port, proto, *, timeout=1):
+        key = (host, port, proto)
+        now = time.monotonic_ns()
+        sock = self._open_sockets.get(key)
+        if sock is not None and self._socket_free[sock]:
+            if now - self._idleSince.get(sock, now) > self._maxIdleNs:
+                # most likely closed by the server already
+                self.expired += 1
+                self._close_socket(sock)
+            else:
+                self.hits += 1
+                self._idleSince.pop(sock, None)
+                self._socket_free[sock] = False
+                return sock
+
+        self.misses += 1
+        self._evict()
+        sock = super()._get_socket(host, port, proto, timeout=timeout)
+        elapsed = (time.monotonic_ns() - now) // 1_000_000
+        self.handshakes += 1
+        self.handshakeMs += elapsed
+        if getattr(sock, "session_reused", False):
+            self.resumed += 1
+        return sock
+
+    def _free_socket(self, socket):
+        super()._free_socket(socket)
+        self._idleSince[socket] = time.monotonic_ns()
+        # TLS 1.3 session tickets arrive after the handshake, the session is complete once a response was read
+        self._rememberSession(socket)
+
+    def _close_socket(self, sock):
+        self._idleSince.pop(sock, None)
+        super()._close_socket(sock)
+
+    def close(self):
+        """ Close all idle sockets """
+        self._free_sockets()
+
+    @property
+    def averageHandshakeMs(self) -> float:
+        return self.handshakeMs / self.handshakes if self.handshakes > 0 else 0.0
+
+    def _evict(self):
+        # close the least recently used idle sockets to make room for a new one
+        while len(self._open_sockets) >= self._maxSockets and len(self._idleSince) > 0:
+            oldest = None
+            for sock in self._idleSince:
+                if oldest is None or self._idleSince[sock] < self._idleSince[oldest]:
+                    oldest = sock
+            self.evicted += 1
+            self._close_socket(oldest)
+
+    def _rememberSession(self, sock):
+        if self._resuming is None or not self._resuming.supported:
+            return
+        session = getattr(sock, "session", None)
+        if session is None:
+            return
+        for host, port, proto in self._open_sockets:
+            if proto == "https:" and self._open_sockets[(host, port, proto)] is sock:
+                self._resuming.sessions[host] = session
+                return
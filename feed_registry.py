@@ -0,0 +1,119 @@
+import json
+import time
+
+# Registry of the Adafruit IO feeds that are known to exist
+#
+# Looking up (and creating) every feed on boot costs a blocking HTTPS round trip per feed before anything can be sent.
+# The registry keeps the feed keys it confirmed in a small JSON file on flash, so on boot known feeds are used right
+# away. A feed that is not known yet is queued the first time data is sent to it and resolved by resolve(), a
+# scheduled task that looks up one feed per run and creates it when it doesn't exist. A feed that can't be resolved
+# goes to the back of the queue. Entries older than ttl seconds are still used, but are queued to be confirmed again.
+# The file is ignored when it was written by another version of the registry or for another group.
+#
+# Feeds are kept in one group so the values of several feeds can be sent in one request (groups/<group>/data).
+
+_VERSION = 1
+
+
+class FeedRegistry:
+    def __init__(self, username:str, key:str, path:str=None, *, group:str='default', ttl:float=7 * 24 * 3600, clock=time.time):
+        self._url = "https://io.adafruit.com/api/v2/" + username + "/"
+        self._headers = {"X-AIO-KEY": key}
+        self._path = path
+        self.group = group
+        self._ttl = ttl
+        self._clock = clock
+        # feed key => time it was last confirmed
+        self._feeds = {}
+        # feed keys to look up, in order of first use
+        self._pending = []
+        self.lookups = 0
+        self.created = 0
+        self._load()
+
+    @property
+    def pending(self) -> bool:
+        """ True when there are feeds waiting to be looked up """
+        return len(self._pending) > 0
+
+    @property
+    def groupDataUrl(self) -> str:
+        return self._url + "groups/" + self.group + "/data"
+
+    @property
+    def headers(self) -> dict:
+        return self._headers
+
+    def known(self, key:str) -> bool:
+        """ True when the feed is known to exist, unknown and stale feeds are queued to be looked up """
+        confirmed = self._feeds.get(key)
+        if (confirmed is None or self._clock() - confirmed > self._ttl) and key not in self._pending:
+            self._pending.append(key)
+        return confirmed is not None
+
+    def forget(self, key:str):
+        """ Called when the feed turned out to be missing, it's looked up again before it's used """
+        if self._feeds.pop(key, None) is not None:
+            self._save()
+        if key not in self._pending:
+            self._pending.append(key)
+
+    async def resolve(self, requests):
+        """ Look up the first pending feed and create it when it doesn't exist """
+        if len(self._pending) == 0:
+            return
+        key = self._pending[0]
+        fullKey = key if self.group == 'default' else self.group + "." + key
+        try:
+            self.lookups += 1
+            with requests.get(self._url + "feeds/" + fullKey, headers=self._headers) as response:
+                status = response.status_code
+            if status == 404:
+                if self.group == 'default':
+                    url = self._url + "feeds"
+                else:
+                    url = self._url + "groups/" + self.group + "/feeds"
+                with requests.post(url, json={"feed": {"name": key, "key": key}}, headers=self._headers) as response:
+                    status = response.status_code
+                if status < 300:
+                    self.created += 1
+        except Exception as ex:
+            print("Adafruit IO feed lookup failed: ", ex)
+            self._requeue(key)
+            return
+        if status >= 300:
+            # e.g. throttled or the feed limit of the account is reached, the other feeds go first
+            print("Adafruit IO feed {} could not be resolved, status {}".format(key, status))
+            self._requeue(key)
+            return
+
+        self._pending.pop(0)
+        self._feeds[key] = self._clock()
+        self._save()
+
+    def _requeue(self, key:str):
+        # a feed that keeps failing must not block the feeds behind it
+        self._pending.pop(0)
+        self._pending.append(key)
+
+    def _load(self):
+        if self._path is None:
+            return
+        try:
+            with open(self._path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == _VERSION and data.get("group") == self.group:
+            self._feeds = data.get("feeds", {})
+
+    def _save(self):
+        if self._path is None:
+            return
+        try:
+            with open(self._path, "w") as file:
+                json.dump({"version": _VERSION, "group": self.group, "feeds": self._feeds}, file)
+        except OSError as ex:
+            # read-only filesystem, the feeds are looked up again after a reboot
+            print("Adafruit IO feed registry can't be saved: ", ex)
+            self._path = None
@@ -0,0 +1,62 @@
+# Interrupt driven gesture input for the APDS9960
+#
+# Instead of reading the gesture FIFO over I2C ten times a second the sensor raises its INT line when something comes
+# close (proximity interrupt) and only then the gestures are read. The INT line is active low and open drain, it is
+# watched by keypad.Keys which scans the pin in the background and queues an event on every edge, so checking for a
+# pending interrupt is a RAM only operation. The interrupt is cleared after every read, it's raised again as long as
+# the hand stays close.
+#
+# Handlers are registered per gesture and called with the gesture code.
+
+GESTURE_UP = 0x01
+GESTURE_DOWN = 0x02
+GESTURE_LEFT = 0x03
+GESTURE_RIGHT = 0x04
+
+
+class GestureInput:
+    def __init__(self, sensor, interrupt, *, proximity_threshold:int=175):
+        """ interrupt is a keypad.Keys (or anything with an events queue like it) that watches the INT pin """
+        self._sensor = sensor
+        self._interrupt = interrupt
+        self._handlers = {}
+        self._pending = False
+        self.interrupts = 0
+        self.reads = 0
+        self.gestures = 0
+        sensor.enable_proximity = True
+        sensor.enable_gesture = True
+        sensor.proximity_interrupt_threshold = (0, proximity_threshold)
+        sensor.enable_proximity_interrupt = True
+        sensor.clear_interrupt()
+
+    def add_handler(self, gesture:int, handler):
+        """ handler(gesture) is called when the gesture is seen """
+        handlers = self._handlers.get(gesture)
+        if handlers is None:
+            self._handlers[gesture] = [handler]
+        else:
+            handlers.append(handler)
+
+    async def poll(self):
+        """ Read and dispatch a gesture when the interrupt is pending, doesn't touch the I2C bus otherwise """
+        events = self._interrupt.events
+        event = events.get()
+        while event is not None:
+            if event.pressed:
+                self.interrupts += 1
+            self._pending = event.pressed
+            event = events.get()
+        if not self._pending:
+            return
+
+        gesture = self._sensor.gesture()
+        self.reads += 1
+        self._sensor.clear_interrupt()
+        if gesture == 0:
+            return
+        self.gestures += 1
+        handlers = self._handlers.get(gesture)
+        if handlers is not None:
+            for handler in handlers:
+                handler(gesture)
@@ -0,0 +1,105 @@
+from array import array
+
+# Multi-resolution history of a measurement
+#
+# Every tier is a ring of fixed size buckets that keep the minimum, maximum, mean and number of samples of their time
+# span, e.g. 30 s buckets for the last hour, 5 minute buckets for the last day and hourly buckets for the last week.
+# Samples are added to the current bucket of every tier directly, so the rollup is incremental and exact, and the
+# memory footprint is fixed when the series is created: 14 bytes per bucket.
+# Buckets are aligned to the timestamps passed in (seconds), buckets without samples are kept empty.
+
+MEAN = 0
+MINIMUM = 1
+MAXIMUM = 2
+
+# (bucket seconds, number of buckets)
+DEFAULT_TIERS = ((30, 120), (300, 288), (3600, 168))
+
+_NAN = float('nan')
+
+
+class Tier:
+    def __init__(self, resolution:int, size:int):
+        self.resolution = resolution
+        self.size = size
+        self.mean = array('f', [0.0] * size)
+        self.minimum = array('f', [0.0] * size)
+        self.maximum = array('f', [0.0] * size)
+        self.count = array('H', [0] * size)
+        # index and start time of the current bucket
+        self._head = 0
+        self._start = None
+        self._filled = 0
+
+    def __len__(self):
+        """ Number of buckets covered so far, including empty ones """
+        return self._filled
+
+    def add(self, value:float, now:int):
+        start = now - now % self.resolution
+        head = self._head
+        if self._start is None:
+            self._start = start
+            self._filled = 1
+            self.count[head] = 0
+        elif start > self._start:
+            steps = (start - self._start) // self.resolution
+            for _ in range(min(steps, self.size)):
+                head = (head + 1) % self.size
+                self.count[head] = 0
+            self._head = head
+            self._start = start
+            self._filled = min(self.size, self._filled + steps)
+        # a clock that went back adds to the current bucket
+
+        count = self.count[head]
+        if count == 0:
+            self.mean[head] = value
+            self.minimum[head] = value
+            self.maximum[head] = value
+        else:
+            self.mean[head] += (value - self.mean[head]) / (count + 1)
+            if value < self.minimum[head]:
+                self.minimum[head] = value
+            if value > self.maximum[head]:
+                self.maximum[head] = value
+        if count < 0xFFFF:
+            self.count[head] = count + 1
+
+    def read_into(self, buffer, field:int=MEAN) -> int:
+        """ Copy the newest buckets into buffer, oldest first, returns the number of values written
+        Empty buckets are written as NaN.
+        """
+        values = self.mean if field == MEAN else self.minimum if field == MINIMUM else self.maximum
+        count = min(len(buffer), self._filled)
+        index = (self._head - count + 1) % self.size
+        for i in range(count):
+            buffer[i] = values[index] if self.count[index] > 0 else _NAN
+            index = (index + 1) % self.size
+        return count
+
+    def extent(self, count:int=None):
+        """ Lowest minimum and highest maximum of the newest count buckets, None when they're all empty """
+        if count is None or count > self._filled:
+            count = self._filled
+        low = None
+        high = None
+        index = self._head
+        for _ in range(count):
+            if self.count[index] > 0:
+                if low is None or self.minimum[index] < low:
+                    low = self.minimum[index]
+                if high is None or self.maximum[index] > high:
+                    high = self.maximum[index]
+            index = (index - 1) % self.size
+        return (low, high) if low is not None else None
+
+
+class Series:
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = [Tier(resolution, size) for resolution, size in tiers]
+
+    def add(self, value:float, now:int):
+        """ Add a sample taken at now (seconds) to every tier """
+        for tier in self.tiers:
+            tier.add(value, now)
@@ -0,0 +1,163 @@
+import json
+import time
+
+# HTTP response cache for periodic fetches
+#
+# Keeps the value extracted from the last response per URL together with its validators (ETag, Last-Modified) and
+# an expiry time from Cache-Control max-age or Expires. While the entry is fresh no request is made at all, once it
+# expired the request is made conditional so an unchanged resource is answered with 304 Not Modified and no body.
+# Only extracted values are kept, not response bodies, so they have to be JSON serializable when the cache is
+# persisted. The file is only written when a new value or new validators were received, not on every revalidation
+# or unchanged 200 response, to spare the flash.
+
+FRESH = 0
+
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _days_from_civil(year, month, day):
+    # days since 1970-01-01 in the proleptic Gregorian calendar
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def parse_http_date(value:str) -> int:
+    """ Seconds since the epoch of an IMF-fixdate like 'Sun, 06 Nov 1994 08:49:37 GMT', None when it's invalid """
+    try:
+        _, day, month, year, clock, zone = value.split()
+        hour, minute, second = clock.split(":")
+        if zone != "GMT":
+            return None
+        days = _days_from_civil(int(year), _MONTHS.index(month) + 1, int(day))
+        return days * 86400 + int(hour) * 3600 + int(minute) * 60 + int(second)
+    except ValueError:
+        return None
+
+
+class _Entry:
+    __slots__ = ("value", "etag", "lastModified", "expires")
+
+    def __init__(self, value, etag, lastModified, expires):
+        self.value = value
+        self.etag = etag
+        self.lastModified = lastModified
+        self.expires = expires
+
+
+class HttpCache:
+    def __init__(self, path:str=None, default_ttl:int=0, clock=time.time):
+        self._path = path
+        self._defaultTtl = default_ttl
+        self._clock = clock
+        self._entries = {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        if path is not None:
+            self._load()
+
+    def get(self, requests, url:str, extract, headers:dict=None):
+        """ Returns (status, value) with the value extracted from the response or the cache
+        The status is FRESH when the cached value was used without a request, 304 when the server confirmed the
+        cached value and 200 when extract(response) was called on a new response. The value is None for any other
+        status, a failed request doesn't invalidate the cached value.
+        """
+        now = self._clock()
+        entry = self._entries.get(url)
+        if entry is not None and now < entry.expires:
+            self.hits += 1
+            return FRESH, entry.value
+
+        headers = dict(headers) if headers else {}
+        if entry is not None:
+            if entry.etag is not None:
+                headers["If-None-Match"] = entry.etag
+            if entry.lastModified is not None:
+                headers["If-Modified-Since"] = entry.lastModified
+
+        with requests.get(url, headers=headers) as response:
+            status = response.status_code
+            if status == 304 and entry is not None:
+                self.revalidated += 1
+                entry.expires = self._expires(response.headers, now)
+                return status, entry.value
+            if status != 200:
+                return status, None
+
+            self.misses += 1
+            value = extract(response)
+            cacheControl = response.headers.get("cache-control", "")
+            if "no-store" in cacheControl:
+                self._entries.pop(url, None)
+                return status, value
+            etag = response.headers.get("etag")
+            lastModified = response.headers.get("last-modified")
+            expires = self._expires(response.headers, now)
+        if entry is not None and entry.value == value and entry.etag == etag and entry.lastModified == lastModified:
+            # a server without validators answers every poll with the same document, only the expiry moves
+            entry.expires = expires
+            return status, value
+        self._entries[url] = _Entry(value, etag, lastModified, expires)
+        self._save()
+        return status, value
+
+    def value(self, url:str):
+        """ The last value extracted for the url, fresh or not """
+        entry = self._entries.get(url)
+        return entry.value if entry is not None else None
+
+    def _expires(self, headers, now) -> int:
+        cacheControl = headers.get("cache-control")
+        if cacheControl is not None:
+            maxAge = None
+            for directive in cacheControl.split(","):
+                directive = directive.strip().lower()
+                if directive == "no-cache" or directive == "no-store":
+                    return now
+                if directive.startswith("max-age="):
+                    try:
+                        maxAge = int(directive[8:])
+                    except ValueError:
+                        return now
+            if maxAge is not None:
+                try:
+                    age = int(headers.get("age", 0))
+                except ValueError:
+                    age = 0
+                return now + maxAge - age
+        expires = headers.get("expires")
+        if expires is not None:
+            # relative to the server's Date so a skewed local clock doesn't matter
+            expiresAt = parse_http_date(expires)
+            date = parse_http_date(headers.get("date", ""))
+            if expiresAt is None:
+                return now
+            return now + expiresAt - (date if date is not None else now)
+        return now + self._defaultTtl
+
+    def _load(self):
+        try:
+            with open(self._path, "r") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return
+        for url, entry in entries.items():
+            self._entries[url] = _Entry(entry[0], entry[1], entry[2], entry[3])
+
+    def _save(self):
+        if self._path is None:
+            return
+        entries = {}
+        for url, entry in self._entries.items():
+            entries[url] = (entry.value, entry.etag, entry.lastModified, entry.expires)
+        try:
+            with open(self._path, "w") as file:
+                json.dump(entries, file)
+        except OSError as ex:
+            print("HTTP cache can't be written: ", ex)
+            self._path = None
@@ -0,0 +1,145 @@
+import json
+
+# Streaming JSON field extractor
+#
+# Reads a JSON document chunk by chunk and only materialises the values at the requested key paths, e.g.
+# ("liveweer", 0, "temp") for document["liveweer"][0]["temp"]. Everything else is skipped byte by byte, so the memory
+# needed is the size of a chunk plus the extracted values instead of the whole document. Reading stops as soon as all
+# paths were found. Paths can't be nested in each other, a value is only captured when no enclosing container is.
+
+_QUOTE = 0x22
+_BACKSLASH = 0x5C
+_COMMA = 0x2C
+_COLON = 0x3A
+_OBJECT_START = 0x7B
+_OBJECT_END = 0x7D
+_ARRAY_START = 0x5B
+_ARRAY_END = 0x5D
+_WHITESPACE = b" \t\r\n"
+
+
+class JsonExtractor:
+    def __init__(self, paths):
+        self._paths = paths
+        self.values = {}
+        # key or index per level of the current position and whether that level is an object
+        self._path = []
+        self._objects = []
+        self._expectKey = False
+        self._inString = False
+        self._isKey = False
+        self._escape = False
+        self._inLiteral = False
+        self._key = bytearray()
+        self._capture = None
+        self._capturePath = None
+        self._captureDepth = 0
+
+    @property
+    def done(self) -> bool:
+        return len(self.values) == len(self._paths)
+
+    def feed(self, chunk) -> bool:
+        """ Process the next chunk of the document, returns True once all paths were found """
+        for b in chunk:
+            if self._inString:
+                self._string(b)
+                continue
+            if self._inLiteral:
+                if b != _COMMA and b != _OBJECT_END and b != _ARRAY_END and b not in _WHITESPACE:
+                    if self._capture is not None:
+                        self._capture.append(b)
+                    continue
+                self._inLiteral = False
+                self._endValue()
+            if b in _WHITESPACE:
+                continue
+
+            if b == _COMMA or b == _COLON or (b == _QUOTE and self._expectKey):
+                # part of a captured container
+                if self._capture is not None:
+                    self._capture.append(b)
+            if b == _COMMA:
+                if self._objects[-1]:
+                    self._expectKey = True
+                else:
+                    self._path[-1] += 1
+            elif b == _COLON:
+                self._expectKey = False
+            elif b == _OBJECT_END or b == _ARRAY_END:
+                if self._capture is not None:
+                    self._capture.append(b)
+                self._path.pop()
+                self._objects.pop()
+                # an empty object leaves expectKey set, the value that follows the container is no key
+                self._expectKey = False
+                self._endValue()
+            elif b == _QUOTE and self._expectKey:
+                self._inString = True
+                self._isKey = True
+                self._key = bytearray()
+            else:
+                # start of a value
+                self._startValue()
+                if self._capture is not None:
+                    self._capture.append(b)
+                if b == _OBJECT_START or b == _ARRAY_START:
+                    self._objects.append(b == _OBJECT_START)
+                    self._path.append(0)
+                    self._expectKey = b == _OBJECT_START
+                elif b == _QUOTE:
+                    self._inString = True
+                    self._isKey = False
+                else:
+                    self._inLiteral = True
+            if self.done:
+                return True
+        return self.done
+
+    def _string(self, b):
+        if self._isKey:
+            if self._capture is not None:
+                self._capture.append(b)
+            if not self._escape and b == _QUOTE:
+                self._inString = False
+                key = self._key
+                self._path[-1] = json.loads(str(b'"' + key + b'"', "utf-8")) if _BACKSLASH in key else str(key, "utf-8")
+                return
+            self._key.append(b)
+        elif self._capture is not None:
+            self._capture.append(b)
+        if self._escape:
+            self._escape = False
+        elif b == _BACKSLASH:
+            self._escape = True
+        elif b == _QUOTE:
+            self._inString = False
+            self._endValue()
+
+    def _startValue(self):
+        if self._capture is not None:
+            return
+        for path in self._paths:
+            if len(path) == len(self._path) and path not in self.values:
+                for i in range(len(path)):
+                    if path[i] != self._path[i]:
+                        break
+                else:
+                    self._capture = bytearray()
+                    self._capturePath = path
+                    self._captureDepth = len(self._path)
+                    return
+
+    def _endValue(self):
+        if self._capture is not None and len(self._path) == self._captureDepth:
+            self.values[self._capturePath] = json.loads(str(self._capture, "utf-8"))
+            self._capture = None
+
+
+def extract(chunks, paths) -> dict:
+    """ Values at the given key paths in the JSON document read from chunks, keyed by path """
+    extractor = JsonExtractor(paths)
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    return extractor.values
@@ -0,0 +1,95 @@
+from adafruit_datetime import datetime, timedelta, tzinfo
+
+# Ordinal of 1970-01-01, used to turn dates into seconds since the epoch
+_EPOCH_ORDINAL = 719163
+_DAYS_BEFORE_MONTH = (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+
+def _ordinal(year, month, day):
+    y = year - 1
+    days = y * 365 + y // 4 - y // 100 + y // 400 + _DAYS_BEFORE_MONTH[month] + day
+    if month > 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        days += 1
+    return days
+
+
+def _last_sunday(year, month, last_day):
+    ordinal = _ordinal(year, month, last_day)
+    # weekday with monday as 0, sunday is 6
+    return ordinal - ((ordinal + 6) % 7 + 1) % 7
+
+
+def _seconds(dt):
+    return (dt.toordinal() - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+class EuropeanTimeZone(tzinfo):
+    """ Time zone following the EU summer time rule:
+    summer time starts on the last sunday of march and ends on the last sunday of october, both at 01:00 UTC.
+    Transitions are computed once per year as seconds since the epoch and the current interval is cached,
+    so most lookups are a single comparison.
+    """
+    def __new__(cls, *args):
+        return super(tzinfo, cls).__new__(cls)
+
+    def __init__(self, name:str, standard_offset_hours:int):
+        self._name = name
+        self._standardSeconds = standard_offset_hours * 3600
+        self._standard = timedelta(hours=standard_offset_hours)
+        self._summer = timedelta(hours=standard_offset_hours + 1)
+        self._noDst = timedelta(hours=0)
+        self._dst = timedelta(hours=1)
+        # cached interval [start, end) in UTC seconds and whether it is summer time
+        self._start = 0
+        self._end = 0
+        self._isDst = False
+
+    def utcoffset(self, dt):
+        return self._summer if self._is_dst(dt, True) else self._standard
+
+    def tzname(self, dt):
+        return self._name
+
+    def dst(self, dt):
+        return self._dst if self._is_dst(dt, True) else self._noDst
+
+    def fromutc(self, dt):
+        if not isinstance(dt, datetime):
+            raise TypeError("fromutc() requires a datetime argument")
+        if dt.tzinfo is not None:
+            raise ValueError("dt.tzinfo is another timezone")
+
+        offset = self._summer if self._is_dst(dt, False) else self._standard
+        return (dt + offset).replace(tzinfo=self)
+
+    def transitions(self, year:int):
+        """ Start and end of summer time in the given year as UTC seconds since the epoch """
+        return ((_last_sunday(year, 3, 31) - _EPOCH_ORDINAL) * 86400 + 3600,
+                (_last_sunday(year, 10, 31) - _EPOCH_ORDINAL) * 86400 + 3600)
+
+    def _is_dst(self, dt, local:bool) -> bool:
+        if not isinstance(dt, datetime):
+            raise TypeError("dst() requires a datetime argument")
+
+        seconds = _seconds(dt)
+        if local:
+            # wall clock time, times skipped in spring are taken as standard time
+            # and times repeated in autumn as summer time, like zoneinfo with fold=0
+            seconds -= self._standardSeconds + 3600
+        if self._start <= seconds < self._end:
+            return self._isDst
+
+        start, end = self.transitions(dt.year)
+        if seconds < start:
+            self._start = self.transitions(dt.year - 1)[1]
+            self._end = start
+            self._isDst = False
+        elif seconds < end:
+            self._start = start
+            self._end = end
+            self._isDst = True
+        else:
+            self._start = end
+            self._end = self.transitions(dt.year + 1)[0]
+            self._isDst = False
+        return self._isDst
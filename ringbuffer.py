@@ -1,30 +1,158 @@
-# From Pyhton Cookbook
+from array import array
+
+# Based on the ring buffer from the Pyhton Cookbook
 # Credit: Sébastien Keim
 # https://www.oreilly.com/library/view/python-cookbook/0596001673/ch05s19.html
+#
+# The values are kept in a preallocated float array and the statistics (sum, mean, min, max and optionally an
+# exponential moving average and the median) are updated on append, so reading them never allocates.
+# Min and max use monotonic queues of sequence numbers, which makes append amortized O(1). The median keeps a sorted
+# copy of the values and costs O(n) moves per append, so it's only maintained when asked for.
 class RingBuffer:
-    """ class that implements a not-yet-full buffer """
-    def __init__(self,size_max):
+    """ class that implements a fixed size buffer of floats with running statistics """
+    def __init__(self, size_max, ema_alpha:float=None, median:bool=False):
         self.max = size_max
-        self.data = []
-
-    class __Full:
-        """ class that implements a full buffer """
-        def append(self, x):
-            """ Append an element overwriting the oldest one. """
-            self.data[self.cur] = x
-            self.cur = (self.cur+1) % self.max
-        def get(self):
-            """ return list of elements in correct order """
-            return self.data[self.cur:]+self.data[:self.cur]
-
-    def append(self,x):
-        """append an element at the end of the buffer"""
-        self.data.append(x)
-        if len(self.data) == self.max:
-            self.cur = 0
-            # Permanently change self's class from non-full to full
-            self.__class__ = self.__Full
+        self.data = array('f', [0.0] * size_max)
+        self.sum = 0.0
+        self.ema = None
+        self._alpha = ema_alpha
+        # sequence number of the next value
+        self._appended = 0
+        # monotonic queues of sequence numbers, values increase from head to tail for min and decrease for max
+        self._minQueue = [0] * size_max
+        self._minHead = 0
+        self._minLength = 0
+        self._maxQueue = [0] * size_max
+        self._maxHead = 0
+        self._maxLength = 0
+        self._sorted = array('f', [0.0] * size_max) if median else None
+
+    def __len__(self):
+        return self._appended if self._appended < self.max else self.max
+
+    def __getitem__(self, index):
+        """ Element by position, 0 is the oldest """
+        count = len(self)
+        if index < 0:
+            index += count
+        if index < 0 or index >= count:
+            raise IndexError("index out of range")
+        return self.data[(self._appended - count + index) % self.max]
+
+    def __iter__(self):
+        """ Iterate from the oldest to the newest element without copying the buffer """
+        for seq in range(self._appended - len(self), self._appended):
+            yield self.data[seq % self.max]
+
+    def append(self, x):
+        """append an element at the end of the buffer, overwriting the oldest one when full"""
+        seq = self._appended
+        index = seq % self.max
+        full = seq >= self.max
+        if full:
+            evicted = self.data[index]
+            self.sum -= evicted
+            if self._sorted is not None:
+                self._removeSorted(evicted)
+
+        self.data[index] = x
+        # use the value as stored so the statistics match the buffer contents
+        x = self.data[index]
+        self._appended = seq + 1
+        self.sum += x
+        if full and index == self.max - 1:
+            # recompute once per lap so rounding errors don't accumulate
+            self._resum()
+
+        self._pushMin(seq, x)
+        self._pushMax(seq, x)
+        if self._sorted is not None:
+            self._insertSorted(x)
+        if self._alpha is not None:
+            self.ema = x if self.ema is None else self.ema + self._alpha * (x - self.ema)
 
     def get(self):
         """ Return a list of elements from the oldest to the newest. """
-        return self.data
\ No newline at end of file
+        return list(self)
+
+    @property
+    def mean(self) -> float:
+        count = len(self)
+        return self.sum / count if count > 0 else 0.0
+
+    @property
+    def minimum(self) -> float:
+        return self.data[self._minQueue[self._minHead] % self.max] if self._minLength > 0 else None
+
+    @property
+    def maximum(self) -> float:
+        return self.data[self._maxQueue[self._maxHead] % self.max] if self._maxLength > 0 else None
+
+    @property
+    def median(self) -> float:
+        count = len(self)
+        if self._sorted is None or count == 0:
+            return None
+        middle = count // 2
+        if count % 2 == 1:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+    def _resum(self):
+        total = 0.0
+        for i in range(len(self)):
+            total += self.data[i]
+        self.sum = total
+
+    def _pushMin(self, seq, x):
+        queue = self._minQueue
+        size = self.max
+        # drop the head when it fell out of the window
+        if self._minLength > 0 and queue[self._minHead] <= seq - size:
+            self._minHead = (self._minHead + 1) % size
+            self._minLength -= 1
+        # drop larger or equal values from the tail, they can never be the minimum again
+        while self._minLength > 0 and self.data[queue[(self._minHead + self._minLength - 1) % size] % size] >= x:
+            self._minLength -= 1
+        queue[(self._minHead + self._minLength) % size] = seq
+        self._minLength += 1
+
+    def _pushMax(self, seq, x):
+        queue = self._maxQueue
+        size = self.max
+        if self._maxLength > 0 and queue[self._maxHead] <= seq - size:
+            self._maxHead = (self._maxHead + 1) % size
+            self._maxLength -= 1
+        while self._maxLength > 0 and self.data[queue[(self._maxHead + self._maxLength - 1) % size] % size] <= x:
+            self._maxLength -= 1
+        queue[(self._maxHead + self._maxLength) % size] = seq
+        self._maxLength += 1
+
+    def _removeSorted(self, x):
+        values = self._sorted
+        count = self.max
+        i = self._bisect(x, count)
+        while i < count - 1:
+            values[i] = values[i + 1]
+            i += 1
+
+    def _insertSorted(self, x):
+        # called after _appended was incremented, the last slot is free
+        values = self._sorted
+        count = len(self) - 1
+        i = count
+        while i > 0 and values[i - 1] > x:
+            values[i] = values[i - 1]
+            i -= 1
+        values[i] = x
+
+    def _bisect(self, x, count):
+        low = 0
+        high = count
+        while low < high:
+            middle = (low + high) // 2
+            if self._sorted[middle] < x:
+                low = middle + 1
+            else:
+                high = middle
+        return low
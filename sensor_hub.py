@@ -0,0 +1,74 @@
+import time
+
+# Sensor snapshots shared by all consumers
+#
+# Every property of the sensor drivers is a new I2C read (and for the BME680 a new set of compensation calculations),
+# so consumers reading the same values in the same cycle each pay for the bus traffic. The hub reads every value of a
+# device in one go into a snapshot object that is allocated once and reused. Consumers get the snapshot as long as it
+# is younger than the max age of the device, saved counts the I2C transactions that were skipped because of that.
+
+# I2C transactions for one read of the device
+_ENVIRONMENT_TRANSACTIONS = 5   # trigger, status poll and burst read of the BME680 plus temperature/humidity/pressure
+_LIGHT_TRANSACTIONS = 4         # APDS9960 color_data reads the four 16 bit channels one by one
+
+
+class EnvironmentSnapshot:
+    __slots__ = ("temperature", "humidity", "pressure", "timestamp")
+
+    def __init__(self):
+        self.temperature = None
+        self.humidity = None
+        self.pressure = None
+        self.timestamp = None
+
+
+class LightSnapshot:
+    __slots__ = ("red", "green", "blue", "clear", "timestamp")
+
+    def __init__(self):
+        self.red = None
+        self.green = None
+        self.blue = None
+        self.clear = None
+        self.timestamp = None
+
+
+class SensorHub:
+    def __init__(self, environmental_sensor, light_sensor, *, environment_max_age:float=1, light_max_age:float=1):
+        self._environmentalSensor = environmental_sensor
+        self._lightSensor = light_sensor
+        self._environmentMaxAgeNs = int(environment_max_age * 1_000_000_000)
+        self._lightMaxAgeNs = int(light_max_age * 1_000_000_000)
+        self._environment = EnvironmentSnapshot()
+        self._light = LightSnapshot()
+        self.reads = 0
+        self.saved = 0
+
+    def environment(self, max_age:float=None) -> EnvironmentSnapshot:
+        """ Temperature (°C), relative humidity (%) and pressure (hPa), read again when the snapshot is too old """
+        snapshot = self._environment
+        now = time.monotonic_ns()
+        maxAgeNs = self._environmentMaxAgeNs if max_age is None else int(max_age * 1_000_000_000)
+        if snapshot.timestamp is not None and now - snapshot.timestamp <= maxAgeNs:
+            self.saved += _ENVIRONMENT_TRANSACTIONS
+            return snapshot
+        sensor = self._environmentalSensor
+        snapshot.temperature = sensor.temperature
+        snapshot.humidity = sensor.humidity
+        snapshot.pressure = sensor.pressure
+        snapshot.timestamp = now
+        self.reads += 1
+        return snapshot
+
+    def light(self, max_age:float=None) -> LightSnapshot:
+        """ Raw red, green, blue and clear channels, read again when the snapshot is too old """
+        snapshot = self._light
+        now = time.monotonic_ns()
+        maxAgeNs = self._lightMaxAgeNs if max_age is None else int(max_age * 1_000_000_000)
+        if snapshot.timestamp is not None and now - snapshot.timestamp <= maxAgeNs:
+            self.saved += _LIGHT_TRANSACTIONS
+            return snapshot
+        snapshot.red, snapshot.green, snapshot.blue, snapshot.clear = self._lightSensor.color_data
+        snapshot.timestamp = now
+        self.reads += 1
+        return snapshot
@@ -0,0 +1,79 @@
+import time
+from adafruit_datetime import datetime
+
+# Software clock anchored to the RTC
+#
+# Reading the DS3231 is an I2C transaction plus a datetime conversion, the software clock reads it once and then
+# tells the time from time.monotonic_ns(). UTC and local datetimes and the ISO 8601 timestamp are cached per second.
+# The clock re-reads the RTC every reanchor_interval seconds to follow it, set(utc_ns) anchors it to a known time,
+# e.g. right after an NTP sync.
+
+
+class SoftwareClock:
+    def __init__(self, rtc, timezone, reanchor_interval:int=3600):
+        self._rtc = rtc
+        self._timezone = timezone
+        self._reanchorNs = reanchor_interval * 1_000_000_000
+        self._second = None
+        self._utc = None
+        self._local = None
+        self._isoformat = None
+        self._anchorNs = None
+        self.anchor()
+
+    def anchor(self):
+        """ Follow the RTC, a sub-second phase from set() is kept as long as the RTC agrees with it """
+        seconds = time.mktime(self._rtc.datetime)
+        now = time.monotonic_ns()
+        if self._anchorNs is None or abs(seconds - self.seconds(now)) >= 1:
+            self._anchorSeconds = seconds
+            self._anchorNs = now
+        self._anchoredAt = now
+
+    def set(self, utc_ns:int):
+        """ Anchor to a UTC time in nanoseconds since the epoch """
+        now = time.monotonic_ns()
+        self._anchorSeconds = utc_ns // 1_000_000_000
+        self._anchorNs = now - utc_ns % 1_000_000_000
+        self._anchoredAt = now
+        self._second = None
+
+    def utc_ns(self) -> int:
+        """ UTC in nanoseconds since the epoch """
+        now = time.monotonic_ns()
+        if now - self._anchoredAt > self._reanchorNs:
+            self.anchor()
+        return self._anchorSeconds * 1_000_000_000 + now - self._anchorNs
+
+    def seconds(self, now:int=None) -> int:
+        """ UTC in seconds since the epoch """
+        if now is None:
+            return self.utc_ns() // 1_000_000_000
+        return self._anchorSeconds + (now - self._anchorNs) // 1_000_000_000
+
+    def utcnow(self) -> datetime:
+        self._update()
+        return self._utc
+
+    def localnow(self) -> datetime:
+        self._update()
+        if self._local is None:
+            self._local = self._timezone.fromutc(self._utc)
+        return self._local
+
+    def isoformat(self) -> str:
+        """ UTC as ISO 8601 """
+        self._update()
+        if self._isoformat is None:
+            self._isoformat = self._utc.isoformat()
+        return self._isoformat
+
+    def _update(self):
+        second = self.seconds()
+        if second == self._second:
+            return
+        t = time.localtime(second)
+        self._second = second
+        self._utc = datetime(t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+        self._local = None
+        self._isoformat = None
@@ -0,0 +1,133 @@
+import os
+
+# Append-only spool file for telemetry that could not be kept in RAM or uploaded
+#
+# Records are stored as a 2 byte big endian length followed by the record bytes. Records are read back in order, the
+# read position is kept in a small side file (<path>.pos) so a replay continues where it left off after a reboot.
+# Once every record has been replayed both files are removed.
+#
+# ⚠ Warning
+# CircuitPython mounts the filesystem read-only for code.py while USB is connected. Remount it in boot.py with
+# storage.remount("/", readonly=False) to use the spool. When the file can't be written the spool marks itself
+# unavailable and rejects all records.
+
+
+class Spool:
+    def __init__(self, path:str, max_bytes:int=131072):
+        self._path = path
+        self._positionPath = path + ".pos"
+        self._maxBytes = max_bytes
+        self.available = True
+        try:
+            self._size = os.stat(path)[6]
+        except OSError:
+            self._size = 0
+        self._position = 0
+        try:
+            with open(self._positionPath, "r") as file:
+                self._position = int(file.read())
+        except (OSError, ValueError):
+            pass
+        if self._position > self._size:
+            self._position = 0
+
+    @property
+    def pending(self) -> bool:
+        """ True when there are records that have not been replayed yet """
+        return self._position < self._size
+
+    def append(self, record) -> bool:
+        """ Append a record, returns False when the spool is full or can't be written """
+        length = len(record)
+        if not self.available or length > 0xFFFF or self._size + length + 2 > self._maxBytes:
+            return False
+        try:
+            with open(self._path, "ab") as file:
+                file.write(length.to_bytes(2, "big"))
+                file.write(record)
+        except OSError as ex:
+            print("Telemetry spool is not available: ", ex)
+            self.available = False
+            return False
+        self._size += length + 2
+        return True
+
+    def read(self, count:int, max_bytes:int) -> list:
+        """ Return up to count records, at most max_bytes in total, starting at the read position """
+        records = []
+        if not self.pending:
+            return records
+        total = 0
+        torn = None
+        with open(self._path, "rb") as file:
+            file.seek(self._position)
+            while len(records) < count:
+                header = file.read(2)
+                if len(header) < 2:
+                    if len(header) > 0:
+                        torn = self._position + total + 2 * len(records)
+                    break
+                length = int.from_bytes(header, "big")
+                if total + length > max_bytes and len(records) > 0:
+                    break
+                record = file.read(length)
+                if len(record) < length:
+                    # incomplete record at the end of the file, e.g. power was lost while writing
+                    torn = self._position + total + 2 * len(records)
+                    break
+                records.append(record)
+                total += length
+        if torn is not None:
+            self._truncate(torn)
+        return records
+
+    def commit(self, records:list):
+        """ Advance the read position past records returned by read() """
+        for record in records:
+            self._position += len(record) + 2
+        if self._position >= self._size:
+            self._position = 0
+            self._size = 0
+            self._remove(self._path)
+            self._remove(self._positionPath)
+            return
+        try:
+            with open(self._positionPath, "w") as file:
+                file.write(str(self._position))
+        except OSError:
+            pass
+
+    def _truncate(self, length:int):
+        """ Drop the incomplete record at length so later appends line up again
+        CircuitPython files can't be truncated, the unread records are copied to a new file instead.
+        """
+        copyPath = self._path + ".tmp"
+        try:
+            with open(self._path, "rb") as source:
+                with open(copyPath, "wb") as target:
+                    source.seek(self._position)
+                    remaining = length - self._position
+                    while remaining > 0:
+                        chunk = source.read(min(remaining, 512))
+                        if len(chunk) == 0:
+                            break
+                        target.write(chunk)
+                        remaining -= len(chunk)
+            os.remove(self._path)
+            os.rename(copyPath, self._path)
+        except OSError as ex:
+            # appending after the incomplete record would misalign every record that follows
+            print("Telemetry spool is not available: ", ex)
+            self.available = False
+            self._size = length
+            return
+        self._size = length - self._position
+        self._position = 0
+        self._remove(self._positionPath)
+
+    @staticmethod
+    def _remove(path:str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
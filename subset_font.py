@@ -0,0 +1,59 @@
+import struct
+import displayio
+from fontio import Glyph
+try:
+    import bitmaptools
+except ImportError:
+    bitmaptools = None
+
+# Loader for the glyph subset fonts built by tools/build_fonts.py
+#
+# The whole font is read in a single pass when it's loaded, there is no parsing or file access afterwards.
+# Characters that are not part of the subset are simply not rendered, rebuild the fonts when the UI needs new ones.
+
+_HEADER = "<4sHhhhhhh"
+_GLYPH = "<Hhhhhhh"
+
+
+class SubsetFont:
+    def __init__(self, file):
+        magic, count, width, height, x, y, self.ascent, self.descent = struct.unpack(_HEADER, file.read(struct.calcsize(_HEADER)))
+        if magic != b"SUBF":
+            raise ValueError("Not a subset font")
+        self._boundingBox = (width, height, x, y)
+        table = file.read(count * struct.calcsize(_GLYPH))
+        self._glyphs = {}
+        for i in range(count):
+            code, width, height, dx, dy, shift_x, shift_y = struct.unpack_from(_GLYPH, table, i * struct.calcsize(_GLYPH))
+            bitmap = displayio.Bitmap(max(width, 1), max(height, 1), 2)
+            self._readBitmap(file, bitmap, width, height)
+            self._glyphs[code] = Glyph(bitmap, 0, width, height, dx, dy, shift_x, shift_y)
+
+    @staticmethod
+    def _readBitmap(file, bitmap, width, height):
+        stride = (width + 7) // 8
+        if stride * height == 0:
+            return
+        if bitmaptools is not None:
+            bitmaptools.readinto(bitmap, file, bits_per_pixel=1, element_size=1)
+            return
+        rows = file.read(stride * height)
+        for y in range(height):
+            for x in range(width):
+                if rows[y * stride + x // 8] & (0x80 >> (x % 8)):
+                    bitmap[x, y] = 1
+
+    def get_bounding_box(self):
+        return self._boundingBox
+
+    def load_glyphs(self, code_points):
+        # all glyphs are loaded up front
+        pass
+
+    def get_glyph(self, code_point):
+        return self._glyphs.get(code_point)
+
+
+def load_font(path:str) -> SubsetFont:
+    with open(path, "rb") as file:
+        return SubsetFont(file)
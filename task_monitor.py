@@ -0,0 +1,208 @@
+import time
+from array import array
+import asynccp
+from asynccp.time import Duration
+
+# Per-task scheduler instrumentation
+#
+# Wraps the coroutines handed to asynccp and times every slice, the stretch between being resumed by the loop and
+# yielding back to it. That's the time the task blocks every other task. Scheduled tasks also record how long each
+# run took from start to finish and how late it started compared to its period. Long running tasks (add_task) never
+# finish, for those every slice counts as a run.
+#
+# The statistics of a window are kept in preallocated arrays, millisecond floats in array('f') and a histogram of
+# run times in array('H') with power of two buckets: < 1 ms, < 2 ms, < 4 ms ... < 1024 ms and longer.
+# report() sends a summary per task as metrics and starts a new window.
+
+_BUCKETS = 12
+
+# indexes in TaskStats.stats
+_RUNS = 0
+_TOTAL = 1
+_SQUARES = 2
+_MIN = 3
+_MAX = 4
+_LATE_TOTAL = 5
+_LATE_MAX = 6
+_SLICES = 7
+_BLOCK_TOTAL = 8
+_BLOCK_MAX = 9
+
+
+class TaskStats:
+    def __init__(self, name:str, period_ns:int=None):
+        self.name = name
+        self._periodNs = period_ns
+        self._nextNs = None
+        self.stats = array('f', [0.0] * 10)
+        self.histogram = array('H', [0] * _BUCKETS)
+        self.reset()
+
+    def reset(self):
+        stats = self.stats
+        for i in range(len(stats)):
+            stats[i] = 0.0
+        stats[_MIN] = float('inf')
+        histogram = self.histogram
+        for i in range(_BUCKETS):
+            histogram[i] = 0
+
+    @property
+    def scheduled(self) -> bool:
+        return self._periodNs is not None
+
+    @property
+    def runs(self) -> int:
+        return int(self.stats[_RUNS])
+
+    def percentile(self, fraction:float) -> float:
+        """ Upper bound in ms of the histogram bucket that holds the given fraction of the runs """
+        target = fraction * self.stats[_RUNS]
+        count = 0
+        for i in range(_BUCKETS - 1):
+            count += self.histogram[i]
+            if count >= target:
+                return float(1 << i)
+        return self.stats[_MAX]
+
+    def started(self, now:int):
+        if self._periodNs is None:
+            return
+        expected = self._nextNs
+        if expected is None or now - expected >= self._periodNs:
+            # first run or runs were skipped, follow the actual start
+            expected = now
+        lateMs = (now - expected) / 1_000_000
+        stats = self.stats
+        stats[_LATE_TOTAL] += lateMs
+        if lateMs > stats[_LATE_MAX]:
+            stats[_LATE_MAX] = lateMs
+        self._nextNs = expected + self._periodNs
+
+    def ran(self, elapsed:int):
+        ms = elapsed / 1_000_000
+        stats = self.stats
+        stats[_RUNS] += 1
+        stats[_TOTAL] += ms
+        stats[_SQUARES] += ms * ms
+        if ms < stats[_MIN]:
+            stats[_MIN] = ms
+        if ms > stats[_MAX]:
+            stats[_MAX] = ms
+        bucket = 0
+        limit = 1_000_000
+        while bucket < _BUCKETS - 1 and elapsed >= limit:
+            bucket += 1
+            limit <<= 1
+        if self.histogram[bucket] < 0xFFFF:
+            self.histogram[bucket] += 1
+
+    def blocked(self, elapsed:int):
+        ms = elapsed / 1_000_000
+        stats = self.stats
+        stats[_SLICES] += 1
+        stats[_BLOCK_TOTAL] += ms
+        if ms > stats[_BLOCK_MAX]:
+            stats[_BLOCK_MAX] = ms
+
+
+class _Timed:
+    """ Awaitable that drives a coroutine and times every slice of it """
+    def __init__(self, coroutine, stats:TaskStats, scheduled:bool):
+        self._coroutine = coroutine
+        self._stats = stats
+        self._scheduled = scheduled
+
+    def __await__(self):
+        coroutine = self._coroutine
+        stats = self._stats
+        start = time.monotonic_ns()
+        if self._scheduled:
+            stats.started(start)
+        value = None
+        error = None
+        while True:
+            resumed = time.monotonic_ns()
+            try:
+                if error is None:
+                    yielded = coroutine.send(value)
+                else:
+                    yielded = coroutine.throw(error)
+            except StopIteration as stop:
+                self._finished(start, resumed)
+                return stop.value
+            except BaseException:
+                self._finished(start, resumed)
+                raise
+            elapsed = time.monotonic_ns() - resumed
+            stats.blocked(elapsed)
+            if not self._scheduled:
+                stats.ran(elapsed)
+            error = None
+            try:
+                value = yield yielded
+            except BaseException as ex:
+                value = None
+                error = ex
+
+    def _finished(self, start, resumed):
+        now = time.monotonic_ns()
+        self._stats.blocked(now - resumed)
+        self._stats.ran(now - (start if self._scheduled else resumed))
+
+
+class TaskMonitor:
+    def __init__(self):
+        self.tasks = []
+
+    def wrap(self, name:str, coroutine_function, frequency=None):
+        """ Instrumented version of a coroutine function that is scheduled at the given frequency """
+        if frequency is None:
+            periodNs = None
+        elif isinstance(frequency, Duration):
+            periodNs = frequency.as_nanoseconds()
+        else:
+            periodNs = int(1_000_000_000 / frequency)
+        stats = TaskStats(name, periodNs)
+        self.tasks.append(stats)
+
+        async def instrumented():
+            return await _Timed(coroutine_function(), stats, True)
+        return instrumented
+
+    def instrument(self, name:str, coroutine):
+        """ Instrumented version of a long running coroutine """
+        stats = TaskStats(name)
+        self.tasks.append(stats)
+
+        async def instrumented():
+            return await _Timed(coroutine, stats, False)
+        return instrumented()
+
+    def schedule(self, name:str, frequency, coroutine_function):
+        asynccp.schedule(frequency=frequency, coroutine_function=self.wrap(name, coroutine_function, frequency))
+
+    def add_task(self, name:str, coroutine):
+        asynccp.add_task(self.instrument(name, coroutine))
+
+    def run_later(self, name:str, seconds:float, coroutine):
+        asynccp.run_later(seconds, self.instrument(name, coroutine))
+
+    def report(self, telemetry, timestamp:str=None):
+        """ Send the statistics of every task that ran as metrics and start a new window """
+        for task in self.tasks:
+            stats = task.stats
+            runs = int(stats[_RUNS])
+            if runs == 0:
+                continue
+            mean = stats[_TOTAL] / runs
+            variance = stats[_SQUARES] / runs - mean * mean
+            prefix = 'task.' + task.name
+            telemetry.metric(prefix + '.runMs', stats[_TOTAL], count=runs, min=stats[_MIN], max=stats[_MAX],
+                             stdDev=variance ** 0.5 if variance > 0 else 0.0, timestamp=timestamp)
+            telemetry.metric(prefix + '.p90Ms', task.percentile(0.9), count=1, timestamp=timestamp)
+            slices = int(stats[_SLICES])
+            telemetry.metric(prefix + '.blockMs', stats[_BLOCK_TOTAL], count=slices, max=stats[_BLOCK_MAX], timestamp=timestamp)
+            if task.scheduled:
+                telemetry.metric(prefix + '.lateMs', stats[_LATE_TOTAL], count=runs, max=stats[_LATE_MAX], timestamp=timestamp)
+            task.reset()
@@ -0,0 +1,114 @@
+"""Build the glyph subset fonts used by NightwatchUI
+
+Run on the host from the root of the project:
+
+    python tools/build_fonts.py
+
+The characters the UI can render are taken from code.py, the month names in NightwatchUI.months plus the digits and
+separators used by renderTime. Each BDF font is reduced to those glyphs and written next to it as a .subset file that
+subset_font.load_font reads in a single pass.
+
+File layout, little endian:
+    header  magic b"SUBF", glyph count (H), bounding box width, height, x, y (4h), ascent, descent (2h)
+    table   per glyph: code point (H), width, height, dx, dy, shift_x, shift_y (6h)
+    bitmaps per glyph in table order: height rows of (width + 7) // 8 bytes, most significant bit is the leftmost pixel
+"""
+import ast
+import os
+import struct
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEADER = "<4sHhhhhhh"
+GLYPH = "<Hhhhhhh"
+
+
+def ui_months(path):
+    """ Month names from NightwatchUI.months in code.py """
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef) and node.name == "NightwatchUI":
+            for statement in node.body:
+                if isinstance(statement, ast.Assign) and statement.targets[0].id == "months":
+                    return ast.literal_eval(statement.value)
+    raise ValueError("NightwatchUI.months not found in " + path)
+
+
+def ui_fonts(path):
+    """ Characters needed per font: the time label uses HH:MM, the date label the day and the month name """
+    digits = "0123456789 "
+    return {
+        "NotoSans-Bold-60": digits + ":",
+        "NotoSans-Bold-24": digits + "".join(ui_months(path)),
+    }
+
+
+def read_bdf(path, characters):
+    code_points = set(ord(c) for c in characters)
+    font = {"glyphs": {}}
+    glyph = None
+    rows = None
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            fields = line.split()
+            if not fields:
+                continue
+            keyword = fields[0]
+            if rows is not None:
+                if keyword == "ENDCHAR":
+                    if glyph["code"] in code_points:
+                        glyph["bitmap"] = b"".join(rows)
+                        font["glyphs"][glyph["code"]] = glyph
+                    glyph = None
+                    rows = None
+                else:
+                    rows.append(bytes.fromhex(keyword))
+            elif keyword == "FONTBOUNDINGBOX":
+                font["box"] = tuple(int(v) for v in fields[1:5])
+            elif keyword == "FONT_ASCENT":
+                font["ascent"] = int(fields[1])
+            elif keyword == "FONT_DESCENT":
+                font["descent"] = int(fields[1])
+            elif keyword == "STARTCHAR":
+                glyph = {}
+            elif keyword == "ENCODING":
+                glyph["code"] = int(fields[1])
+            elif keyword == "DWIDTH":
+                glyph["shift"] = (int(fields[1]), int(fields[2]))
+            elif keyword == "BBX":
+                glyph["bbx"] = tuple(int(v) for v in fields[1:5])
+            elif keyword == "BITMAP":
+                rows = []
+
+    missing = code_points - set(font["glyphs"])
+    if missing:
+        raise ValueError("{} has no glyphs for {}".format(path, "".join(sorted(chr(c) for c in missing))))
+    return font
+
+
+def write_subset(path, font):
+    glyphs = [font["glyphs"][code] for code in sorted(font["glyphs"])]
+    with open(path, "wb") as file:
+        file.write(struct.pack(HEADER, b"SUBF", len(glyphs), *font["box"], font["ascent"], font["descent"]))
+        for glyph in glyphs:
+            file.write(struct.pack(GLYPH, glyph["code"], *glyph["bbx"], *glyph["shift"]))
+        for glyph in glyphs:
+            width, height = glyph["bbx"][0], glyph["bbx"][1]
+            if len(glyph["bitmap"]) != height * ((width + 7) // 8):
+                raise ValueError("unexpected bitmap size for glyph {}".format(glyph["code"]))
+            file.write(glyph["bitmap"])
+
+
+def main():
+    for name, characters in ui_fonts(os.path.join(ROOT, "code.py")).items():
+        source = os.path.join(ROOT, name + ".bdf")
+        target = os.path.join(ROOT, name + ".subset")
+        write_subset(target, read_bdf(source, characters))
+        print("{}: {} glyphs, {} bytes (bdf {} bytes)".format(
+            target, len(set(characters)), os.path.getsize(target), os.path.getsize(source)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
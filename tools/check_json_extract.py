@@ -0,0 +1,137 @@
+"""Check json_extract.py against json.loads and benchmark it on a sample weather report
+
+Run on the host from the root of the project:
+
+    python tools/check_json_extract.py [documents]
+
+Random documents, with empty containers, escaped keys and strings and all kinds of literals, are fed in random sized
+chunks. Every path in the document is extracted on its own, and all scalars and empty containers together. The values
+must equal the ones json.loads finds. It exits with status 1 on the first mismatch.
+
+The benchmark extracts the fields code.py uses from weather_sample.json, a report in the format of the weerlive.nl
+json-data-10min API, in chunks of 64 bytes like updateWeather does. It reports the peak memory of json.loads and of
+the extractor (tracemalloc, CPython, so only the ratio carries over to the board), the number of chunks read and the
+time per extraction.
+"""
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, "tools", "weather_sample.json")
+
+# the fields read by code.py, see WEATHER_FIELDS
+WEATHER_FIELDS = (("liveweer", 0, "samenv"), ("liveweer", 0, "temp"), ("liveweer", 0, "sup"), ("liveweer", 0, "sunder"))
+CHUNK_SIZE = 64
+
+_STRINGS = ("", "a", "key", "with \"quotes\"", "back\\slash", "ünïcode", "comma, colon: {brace} [bracket]", "\n\t")
+_LITERALS = (None, True, False, 0, -1, 12.5, -1.5e3, 1e-7, 123456789)
+
+
+def random_value(rng, depth):
+    kind = rng.random()
+    if depth > 3 or kind < 0.4:
+        return rng.choice(_LITERALS) if rng.random() < 0.6 else rng.choice(_STRINGS)
+    if kind < 0.7:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {rng.choice(_STRINGS) + str(i): random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+def paths_of(value, prefix=()):
+    yield prefix, value
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from paths_of(item, prefix + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from paths_of(item, prefix + (index,))
+
+
+def chunked(raw, rng):
+    chunks = []
+    i = 0
+    while i < len(raw):
+        size = rng.randrange(1, 17)
+        chunks.append(raw[i:i + size])
+        i += size
+    return chunks
+
+
+def check(documents):
+    from json_extract import extract
+    rng = random.Random(2026)
+    for n in range(documents):
+        document = random_value(rng, 0)
+        raw = json.dumps(document, ensure_ascii=rng.random() < 0.5, indent=rng.choice((None, 1))).encode()
+        expected = {path: value for path, value in paths_of(document) if len(path) > 0}
+        if len(expected) == 0:
+            continue
+        for path, value in expected.items():
+            actual = extract(chunked(raw, rng), (path,))
+            if actual != {path: value}:
+                return "document {}: {} extracted {}, expected {!r}\n{}".format(n, path, actual, value, raw)
+        # paths can't be nested in each other, together only the scalars and empty containers are extracted
+        leaves = {path: value for path, value in expected.items() if not isinstance(value, (dict, list)) or len(value) == 0}
+        actual = extract(chunked(raw, rng), tuple(leaves))
+        if actual != leaves:
+            return "document {}: all leaves extracted {}, expected {}\n{}".format(n, actual, leaves, raw)
+    print("{} random documents: ok".format(documents))
+    return None
+
+
+def peak(function):
+    tracemalloc.start()
+    function()
+    result = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def benchmark():
+    from json_extract import extract
+    with open(SAMPLE, "rb") as file:
+        raw = file.read()
+    chunks = [raw[i:i + CHUNK_SIZE] for i in range(0, len(raw), CHUNK_SIZE)]
+    document = json.loads(raw)
+    expected = {path: document[path[0]][path[1]][path[2]] for path in WEATHER_FIELDS}
+    if extract(iter(chunks), WEATHER_FIELDS) != expected:
+        return "weather sample: the extracted fields don't match json.loads"
+
+    read = [0]
+
+    def counted():
+        for chunk in chunks:
+            read[0] += 1
+            yield chunk
+
+    extract(counted(), WEATHER_FIELDS)
+    loads = peak(lambda: json.loads(b"".join(chunks)))
+    extractor = peak(lambda: extract(iter(chunks), WEATHER_FIELDS))
+    runs = 200
+    start = time.perf_counter()
+    for _ in range(runs):
+        extract(iter(chunks), WEATHER_FIELDS)
+    elapsed = (time.perf_counter() - start) / runs
+    print("weather sample: {} bytes, {} of {} chunks read".format(len(raw), read[0], len(chunks)))
+    print("peak memory: json.loads {} bytes, extract {} bytes".format(loads, extractor))
+    print("extract: {:.0f} us per report".format(elapsed * 1_000_000))
+    return None
+
+
+def main():
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sys.path.insert(0, ROOT)
+    error = check(documents)
+    if error is None:
+        error = benchmark()
+    if error is not None:
+        print(error)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
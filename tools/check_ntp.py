@@ -0,0 +1,162 @@
+"""Check adafruit_ntp.py against local stand-in NTP servers
+
+Run on the host from the root of the project:
+
+    python tools/check_ntp.py
+
+CPython's socket module takes the place of socketpool. Every case starts a UDP server on 127.0.0.1 that answers like
+an NTP server whose clock is OFFSET seconds ahead, but drops, delays or corrupts replies as the case asks. A delayed
+reply is stamped like a server that took that long to answer. sync_async runs next to a task that ticks every 10 ms,
+the largest gap between ticks shows whether the scheduler was blocked.
+It exits with status 1 when a case fails.
+"""
+import asyncio
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NTP_TO_UNIX_EPOCH = 2208988800
+# clock of the stand-in servers relative to the host
+OFFSET = 1234.5
+# allowed error of the measured offset, the stand-ins run on the same host
+TOLERANCE = 0.05
+# largest gap between ticks of the other task before the scheduler counts as blocked
+MAX_GAP = 0.1
+
+
+class Pool:
+    """ The parts of socketpool.SocketPool that adafruit_ntp uses """
+    AF_INET = socket.AF_INET
+    SOCK_DGRAM = socket.SOCK_DGRAM
+
+    def socket(self, family, kind):
+        return socket.socket(family, kind)
+
+    def getaddrinfo(self, host, port):
+        return socket.getaddrinfo(host, port)
+
+
+def _timestamp(seconds):
+    whole = int(seconds)
+    return struct.pack("!II", whole + NTP_TO_UNIX_EPOCH, int((seconds - whole) * 2 ** 32))
+
+
+def start_server(drop=0, delay=0.0, stratum=2, leap=0, originate=True, poll=6):
+    """ Stand-in server, drops the first drop requests and answers the others after delay seconds, returns the port """
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    requests = [0]
+
+    def serve():
+        while True:
+            request, address = server.recvfrom(48)
+            received = time.time() + OFFSET
+            requests[0] += 1
+            if requests[0] <= drop:
+                continue
+            time.sleep(delay)
+            reply = bytearray(48)
+            reply[0] = (leap << 6) | (4 << 3) | 4
+            reply[1] = stratum
+            reply[2] = poll
+            if stratum == 0:
+                reply[12:16] = b"RATE"
+            # the transmit timestamp of the request is returned as the originate timestamp
+            reply[24:32] = request[40:48] if originate else b"\x01" * 8
+            # the time spent before answering is server processing time, the client subtracts it from the delay
+            reply[32:40] = _timestamp(received)
+            reply[40:48] = _timestamp(time.time() + OFFSET)
+            server.sendto(reply, address)
+
+    threading.Thread(target=serve, daemon=True).start()
+    return server.getsockname()[1]
+
+
+async def run_async(port, **options):
+    """ sync_async next to a ticking task, returns (ntp, error, largest gap between ticks in seconds) """
+    import adafruit_ntp
+    ntp = adafruit_ntp.NTP(Pool(), servers=("127.0.0.1",), port=port)
+    done = [False]
+    gap = [0.0]
+
+    async def ticker():
+        last = time.monotonic()
+        while not done[0]:
+            await asyncio.sleep(0.01)
+            now = time.monotonic()
+            gap[0] = max(gap[0], now - last)
+            last = now
+
+    task = asyncio.ensure_future(ticker())
+    error = None
+    try:
+        await ntp.sync_async(asyncio.sleep, **options)
+    except RuntimeError as ex:
+        error = ex
+    done[0] = True
+    await task
+    return ntp, error, gap[0]
+
+
+def offset_error(ntp):
+    return abs(ntp.clock_ns / 1_000_000_000 - time.time() - OFFSET)
+
+
+def check_async(name, server, options, synced):
+    ntp, error, gap = asyncio.run(run_async(start_server(**server), **options))
+    if gap > MAX_GAP:
+        return "{}: the scheduler was blocked for {:.3f} s".format(name, gap)
+    if synced:
+        if error is not None:
+            return "{}: {}".format(name, error)
+        if offset_error(ntp) > TOLERANCE:
+            return "{}: offset is off by {:.3f} s".format(name, offset_error(ntp))
+    elif error is None:
+        return "{}: an unusable reply was accepted".format(name)
+    print("{}: ok, largest gap {:.0f} ms".format(name, gap * 1000))
+    return None
+
+
+def check_blocking():
+    import adafruit_ntp
+    ntp = adafruit_ntp.NTP(Pool(), servers=("127.0.0.1",), port=start_server(), socket_timeout=1)
+    ntp.sync()
+    if offset_error(ntp) > TOLERANCE:
+        return "sync: offset is off by {:.3f} s".format(offset_error(ntp))
+    if ntp.next_sync - time.monotonic_ns() < 60 * 1_000_000_000:
+        return "sync: the poll interval of the reply was not used"
+    print("sync: ok")
+    return None
+
+
+CASES = (
+    # name, stand-in server, sync_async options, expect a usable sample
+    ("reply", {}, {}, True),
+    ("dropped requests are sent again", {"drop": 2}, {"timeout": 0.3, "retries": 2}, True),
+    ("slow reply within the timeout", {"delay": 0.5}, {"timeout": 1}, True),
+    ("reply after the timeout", {"delay": 0.5}, {"timeout": 0.2, "retries": 0}, False),
+    ("no reply", {"drop": 100}, {"timeout": 0.2, "retries": 1}, False),
+    ("reply to another request", {"originate": False}, {"timeout": 0.2, "retries": 0}, False),
+    ("kiss-of-death", {"stratum": 0}, {"timeout": 0.2, "retries": 0}, False),
+    ("unsynchronised server", {"leap": 3}, {"timeout": 0.2, "retries": 0}, False),
+)
+
+
+def main():
+    sys.path.insert(0, ROOT)
+    errors = [check_blocking()]
+    for name, server, options, synced in CASES:
+        errors.append(check_async(name, server, options, synced))
+    errors = [error for error in errors if error is not None]
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
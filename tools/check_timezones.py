@@ -0,0 +1,74 @@
+"""Check the EU summer time rule of lib/timezone_eu.py against the IANA time zone database
+
+Run on the host from the root of the project (Python 3.9 or newer, on Windows also pip install tzdata):
+
+    python tools/check_timezones.py [first year] [last year]
+
+adafruit_datetime follows the API of CPython's datetime module, on the host the standard module takes its place.
+For every zone in ZONES fromutc, utcoffset and dst are compared with zoneinfo, in steps of 30 minutes in the last week
+of march and october and in steps of a little over a day in between. It exits with status 1 on the first mismatch,
+e.g. when the EU changes the rule or a zone leaves it.
+"""
+import datetime as _datetime
+import os
+import sys
+from zoneinfo import ZoneInfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# zone name and standard offset in hours
+ZONES = (("Europe/Amsterdam", 1), ("Europe/London", 0), ("Europe/Lisbon", 0), ("Europe/Helsinki", 2))
+
+
+class _tzinfo(_datetime.tzinfo):
+    # EuropeanTimeZone.__new__ skips the tzinfo class of adafruit_datetime, that must not be the builtin one
+    pass
+
+
+def use_host_datetime():
+    module = type(sys)("adafruit_datetime")
+    module.__dict__.update(_datetime.__dict__)
+    module.tzinfo = _tzinfo
+    sys.modules["adafruit_datetime"] = module
+
+
+def check(name, standard_offset, first, last):
+    from timezone_eu import EuropeanTimeZone
+    timezone = EuropeanTimeZone(name, standard_offset)
+    reference = ZoneInfo(name)
+    utc = ZoneInfo("UTC")
+    count = 0
+    t = _datetime.datetime(first, 1, 1)
+    while t.year <= last:
+        expected = t.replace(tzinfo=utc).astimezone(reference).replace(tzinfo=None)
+        actual = timezone.fromutc(t).replace(tzinfo=None)
+        if actual != expected:
+            return "{} fromutc({}) is {}, expected {}".format(name, t, actual, expected)
+        local = t.replace(tzinfo=reference)
+        if timezone.utcoffset(t) != local.utcoffset():
+            return "{} utcoffset({}) is {}, expected {}".format(name, t, timezone.utcoffset(t), local.utcoffset())
+        if timezone.dst(t) != local.dst():
+            return "{} dst({}) is {}, expected {}".format(name, t, timezone.dst(t), local.dst())
+        count += 1
+        if t.month in (3, 10) and t.day > 24:
+            t += _datetime.timedelta(minutes=30)
+        else:
+            t += _datetime.timedelta(minutes=1440 + 37)
+    print("{}: {} times checked from {} to {}".format(name, count, first, last))
+    return None
+
+
+def main():
+    first = int(sys.argv[1]) if len(sys.argv) > 1 else 1997
+    last = int(sys.argv[2]) if len(sys.argv) > 2 else 2090
+    use_host_datetime()
+    sys.path.insert(0, os.path.join(ROOT, "lib"))
+    for name, offset in ZONES:
+        error = check(name, offset, first, last)
+        if error is not None:
+            print(error)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
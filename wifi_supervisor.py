@@ -0,0 +1,121 @@
+import time
+import asynccp
+
+# WiFi connectivity supervisor
+#
+# Keeps the station connected: connects with a bounded timeout, backs off exponentially between failed attempts and
+# checks the link every few seconds to notice when the access point was lost. Tasks that need the network await
+# wait_connected() and are resumed by the supervisor once the link is up, instead of polling a flag.
+#
+# CircuitPython 7 has no non-blocking connect, radio.connect() blocks the scheduler for at most connect_timeout
+# seconds per attempt. All other steps only read radio.ap_info. step() holds the state machine and can be driven
+# with a fake radio and clock, run() is the scheduler task around it.
+
+
+class WifiState:
+    Disconnected = 0
+    Connecting = 1
+    Connected = 2
+    Backoff = 3
+
+
+class ConnectivityEvent:
+    """ Resumes the tasks waiting for the connection """
+    def __init__(self):
+        self._waiters = []
+
+    async def wait(self):
+        awaitable, resume = asynccp.suspend()
+        self._waiters.append(resume)
+        await awaitable
+
+    def notify(self):
+        waiters = self._waiters
+        self._waiters = []
+        for resume in waiters:
+            resume()
+
+
+class WifiSupervisor:
+    def __init__(self, radio, ssid:str, password:str, *, connect_timeout:float=3, min_backoff:float=1,
+                 max_backoff:float=120, check_interval:float=5, clock=time.monotonic):
+        self._radio = radio
+        self._ssid = ssid
+        self._password = password
+        self._connectTimeout = connect_timeout
+        self._minBackoff = min_backoff
+        self._maxBackoff = max_backoff
+        self._checkInterval = check_interval
+        self._clock = clock
+        self._backoff = 0
+        self._retryAt = 0
+        self._listeners = []
+        self.state = WifiState.Disconnected
+        self.connected_event = ConnectivityEvent()
+        self.connects = 0
+        self.drops = 0
+        self.failures = 0
+        self.lastError = None
+
+    @property
+    def connected(self) -> bool:
+        return self.state == WifiState.Connected
+
+    def add_listener(self, listener):
+        """ listener(state) is called on every state change """
+        self._listeners.append(listener)
+
+    async def wait_connected(self):
+        """ Returns once the link is up """
+        while not self.connected:
+            await self.connected_event.wait()
+
+    def link_lost(self):
+        """ Called by consumers whose requests failed, marks the link down when the access point is gone """
+        if self.state == WifiState.Connected and not self._radio.ap_info:
+            self.drops += 1
+            self._setState(WifiState.Disconnected)
+
+    def step(self, now:float=None) -> float:
+        """ Advance the state machine, returns the number of seconds until the next step """
+        if now is None:
+            now = self._clock()
+        if self.state == WifiState.Connected:
+            if self._radio.ap_info:
+                return self._checkInterval
+            self.drops += 1
+            self._setState(WifiState.Disconnected)
+        elif self.state == WifiState.Backoff and now < self._retryAt:
+            return self._retryAt - now
+
+        if not self._radio.ap_info:
+            self._setState(WifiState.Connecting)
+            self.lastError = None
+            try:
+                self._radio.connect(self._ssid, self._password, timeout=self._connectTimeout)
+            except Exception as ex:
+                self.failures += 1
+                self.lastError = ex
+        if self._radio.ap_info:
+            self._backoff = 0
+            self.connects += 1
+            self._setState(WifiState.Connected)
+            self.connected_event.notify()
+            return self._checkInterval
+
+        self._backoff = min(self._maxBackoff, self._backoff * 2 if self._backoff > 0 else self._minBackoff)
+        self._retryAt = now + self._backoff
+        self._setState(WifiState.Backoff)
+        return self._backoff
+
+    async def run(self):
+        """ Supervisor task, runs forever """
+        while True:
+            await asynccp.delay(self.step())
+
+    def _setState(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        for listener in self._listeners:
+            listener(state)